@@ -1,14 +1,47 @@
 '''app cli module'''
+import argparse
 import random
+import sys
 from shoppinglistapp.core.items import Item, ItemPool
+from shoppinglistapp.core.journal import DEFAULT_SYNC, DEFAULT_WINDOW, \
+    SYNC_MODES, JournaledItemPool
+from shoppinglistapp.core.profiling import CommandProfiler
 from shoppinglistapp.core.shoppinglist import ShoppingList
+from shoppinglistapp.core.snapshot import SnapshotItemPool
+from shoppinglistapp.core.stats import StatsWriter
+from shoppinglistapp.core import commands
 from shoppinglistapp.core.appengine import AppEngine
 
+DEFAULT_PER_PAGE = 20
+ITEMS_CACHE_MAX_LINES = 1000
+ITEMS_CACHE_SIZE = 32
+FIND_LIMIT = 10
+DEFAULT_PROFILE_DIR = 'profiles'
+EMPTY_LIST_MESSAGE = 'The shopping list is empty. Use "list" to create one.'
+
+
+def get_error_message(cmd, err):
+    '''get the reply to a command that raised err'''
+    message = f'"{cmd}" failed: {type(err).__name__}'
+    return f'{message} ({err})' if str(err) else message
+
 
 class AppCLI:
     '''app cli class'''
     def __init__(self, shopping_list=None, items=None):
         self.app_engine = AppEngine(shopping_list, items)
+        self._list_cache = None
+        self._items_cache = {}
+        # CommandProfiler while profiling is on, see process_profile
+        self.profiler = None
+        self.profile_dir = DEFAULT_PROFILE_DIR
+        self.app_engine.handlers.update({
+            commands.ASK: self.process_ask,
+            commands.LIST: self.process_list,
+            commands.SHOW: self.process_show,
+            commands.FIND: self.process_find,
+            commands.PROFILE: self.process_profile,
+        })
 
     def run(self):
         '''run method'''
@@ -18,81 +51,230 @@ class AppCLI:
                 prompt = 'What amount should replace the questionmarks? $'
             cmd = input(prompt)
             self.execute_command(cmd)
-            print(f'{self.app_engine.message}\n')
+            self.write_message(sys.stdout)
+            sys.stdout.write('\n')
             self.app_engine.message = None
 
             if not self.app_engine.continue_execution:
                 break
 
+    def run_script(self, lines, file):
+        '''run commands without prompts, writing replies to file
+
+        Empty lines and lines starting with "#" are skipped. A command
+        that raises gets an error reply and the replay goes on. Stops
+        after a quit command.
+        '''
+        for line in lines:
+            cmd = line.rstrip('\r\n')
+            if not cmd or cmd.startswith('#'):
+                continue
+            try:
+                self.execute_command(cmd)
+            except Exception as err:
+                self.app_engine.message = get_error_message(cmd, err)
+            self.write_message(file)
+            file.write('\n')
+            self.app_engine.message = None
+            if not self.app_engine.continue_execution:
+                break
+
     def execute_command(self, cmd):
         '''execute command method'''
-        if self.app_engine.correct_answer is not None:
-            self.app_engine.process_answer(cmd)
-        elif cmd in ('q', 'quit'):
-            self.app_engine.continue_execution = False
-            self.app_engine.message = 'Have a nice day!'
-        elif cmd in ('a', 'ask'):
-            self.process_ask()
-        elif cmd in ('l', 'list'):
-            self.app_engine.shopping_list.refresh(item_pool=self.
-                                                  app_engine.items)
-            self.app_engine.message = 'Shopping list with ' \
-                f'{len(self.app_engine.shopping_list)} items has been created.'
-        elif cmd.startswith('show'):
-            self.process_show(cmd)
-        elif cmd.startswith('add'):
-            self.app_engine.process_add_item(cmd)
-        elif cmd.startswith('del'):
-            self.app_engine.process_del_item(cmd)
-        else:
-            self.app_engine.message = f'"{cmd}" is not a valid command.'
+        profiler = self.profiler
+        if profiler is None:
+            return self.app_engine.execute(cmd)
+        command_type = profiler.run(self.app_engine.execute, cmd)
+        if self.profiler is None:
+            # "profile off" was run, report outside of the profiled call
+            profiler.finish()
+        return command_type
 
-    def show_list(self, mask_index=None):
-        '''show list method'''
-        line_base_len = len('TOTAL') - 4
-        max_item = max(len(item.name) for item, _ in
-                       self.app_engine.shopping_list.list)
-        line_base_len = max(max_item, line_base_len)
-        total = Item('TOTAL', self.app_engine.shopping_list.get_total_price())
-        max_order = total.get_order()
-        max_name = len(total.name)
-        for item, _ in self.app_engine.shopping_list.list:
-            max_name = max(max_name, len(item.name))
-            max_order = max(max_order, item.get_order())
-        out = 'SHOPPING LIST\n'
-        i = 0
-        for i, (item, quantity) in enumerate(self.
-                                             app_engine.shopping_list.list):
-            hide_price = mask_index == i
-            padding = line_base_len - len(item.name)
-            out += item.get_list_item_str(quantity) + \
-                f' ...{"." * padding} ' + \
-                item.get_price_str(quantity, hide_price, max_order) + '\n'
-        i += 1
-        hide_price = mask_index == i
+    def start_profiling(self):
+        '''profile every following command'''
+        if self.profiler is None:
+            self.profiler = CommandProfiler(self.profile_dir)
+            self.profiler.start()
+
+    def process_list(self, cmd=None):
+        '''process list'''
+        self.app_engine.shopping_list.refresh(item_pool=self.
+                                              app_engine.items)
+        self.app_engine.message = 'Shopping list with ' \
+            f'{len(self.app_engine.shopping_list)} items has been created.'
+
+    def write_message(self, file):
+        '''write the message to a file-like object
+
+        The message is either a string or an iterable of lines (as
+        produced by the iter_*_lines methods), which is written as it is
+        consumed.
+        '''
+        message = self.app_engine.message
+        if isinstance(message, str) or message is None:
+            file.write(f'{message}\n')
+            return
+        for line in message:
+            file.write(line)
+        file.write('\n')
+
+    def _get_list_layout(self):
+        '''get (line_base_len, total item, max_order, max_name)'''
+        shopping_list = self.app_engine.shopping_list
+        line_base_len = max(shopping_list.get_max_name_len(),
+                            len('TOTAL') - 4)
+        total = Item('TOTAL', shopping_list.get_total_price())
+        max_order = max(total.get_order(), shopping_list.get_max_order())
+        max_name = max(len(total.name), shopping_list.get_max_name_len())
+        return line_base_len, total, max_order, max_name
+
+    @staticmethod
+    def _format_list_line(item, quantity, hide_price, layout):
+        '''format one shopping list line'''
+        line_base_len, _, max_order, _ = layout
+        padding = line_base_len - len(item.name)
+        return item.get_list_item_str(quantity) + \
+            f' ...{"." * padding} ' + \
+            item.get_price_str(quantity, hide_price, max_order) + '\n'
+
+    @staticmethod
+    def _format_total_line(hide_price, layout):
+        '''format the total line (without newline)'''
+        _, total, max_order, max_name = layout
         total_padding = max_name - len(total.name) + 5 + 2
-        total_line = total.get_list_item_str(leading_dash=False) \
+        return total.get_list_item_str(leading_dash=False) \
             + f' ...{"." * total_padding} ' + total.get_price_str(
             hide_price=hide_price, order=max_order)
-        return out + '-'*len(total_line) + '\n'+total_line + '\n'
 
-    def show_items(self):
-        '''show items method'''
+    def iter_list_lines(self, mask_index=None):
+        '''yield the lines of the shopping list'''
+        layout = self._get_list_layout()
+        yield 'SHOPPING LIST\n'
+        i = 0
+        for i, (item, quantity) in enumerate(
+                self.app_engine.shopping_list.list):
+            yield self._format_list_line(item, quantity, mask_index == i,
+                                         layout)
+        i += 1
+        total_line = self._format_total_line(mask_index == i, layout)
+        yield '-'*len(total_line) + '\n'
+        yield total_line + '\n'
+
+    def _get_list_render(self):
+        '''get the cached (text, line starts, layout) of the list
+
+        The cache is keyed on the shopping list and its version.
+        '''
+        shopping_list = self.app_engine.shopping_list
+        cached = self._list_cache
+        if cached is not None and cached[0] is shopping_list \
+                and cached[1] == shopping_list.version:
+            return cached[2:]
+        layout = self._get_list_layout()
+        lines = list(self.iter_list_lines())
+        starts = [0]
+        for line in lines:
+            starts.append(starts[-1] + len(line))
+        text = ''.join(lines)
+        self._list_cache = (shopping_list, shopping_list.version, text,
+                            starts, layout)
+        return text, starts, layout
+
+    def show_list(self, mask_index=None):
+        '''show list method
+
+        Renders come from a cache; a masked view only formats the masked
+        line and splices it into the cached text.
+        '''
+        text, starts, layout = self._get_list_render()
+        size = len(self.app_engine.shopping_list.list)
+        if mask_index is None or not 0 <= mask_index <= size:
+            return text
+        if mask_index < size:
+            item, quantity = self.app_engine.shopping_list.list[mask_index]
+            line_no = mask_index + 1
+            line = self._format_list_line(item, quantity, True, layout)
+        else:
+            # total line, after the header, the items and the dashes
+            line_no = size + 2
+            line = self._format_total_line(True, layout) + '\n'
+        return text[:starts[line_no]] + line + text[starts[line_no + 1]:]
+
+    def iter_items_lines(self, page=None, per_page=None, shown=None):
+        '''yield the lines of the item pool, sorted by name
+
+        With ``page`` (1-based) only that page of ``per_page`` items is
+        rendered, and the column widths are those of the page. ``shown``
+        renders the given items in their order instead of the whole pool.
+        '''
+        item_pool = self.app_engine.items.snapshot()
+        items = item_pool.items
+        if shown is not None:
+            if page is not None:
+                start = (page - 1) * per_page
+                shown = shown[start:start + per_page]
+            rows = shown
+        elif page is not None:
+            start = (page - 1) * per_page
+            names = item_pool.get_sorted_names(start, start + per_page)
+            shown = rows = [items[item_name] for item_name in names]
+        else:
+            names = item_pool.get_sorted_names()
+            shown = items.values()
+            rows = (items[item_name] for item_name in names)
         max_name, max_order = 0, 0
-        for item in self.app_engine.items.items.values():
+        for item in shown:
             max_name = max(max_name, len(item.name))
             max_order = max(max_order, item.get_order())
-        out = 'ITEMS\n'
-        for item_name in sorted(self.app_engine.items.items.keys()):
-            item = self.app_engine.items.items[item_name]
-            padding = max_name - len(item_name)
-            out += item.get_list_item_str() + \
+        yield 'ITEMS\n'
+        for item in rows:
+            padding = max_name - len(item.name)
+            yield item.get_list_item_str() + \
                 f' ...{"." * padding} ' + item.get_price_str(order=max_order) \
                 + '\n'
-        return out
 
-    def process_ask(self):
+    def show_items(self, page=None, per_page=None, shown=None):
+        '''show items method'''
+        return ''.join(self.iter_items_lines(page, per_page, shown))
+
+    def get_items_render(self, page=None, per_page=None, low=None,
+                         high=None):
+        '''get the show items output, cached while the pool is unchanged
+
+        Renders of at most ITEMS_CACHE_MAX_LINES lines are kept as text
+        (keyed on the pool version and the query); bigger ones are
+        returned as a line generator and streamed.
+        '''
+        item_pool = self.app_engine.items
+        owner = (item_pool, item_pool.version)
+        if self._items_cache.get('owner') != owner:
+            self._items_cache = {'owner': owner}
+        key = (page, per_page, low, high)
+        text = self._items_cache.get(key)
+        if text is not None:
+            return text
+        shown = None
+        if low is not None or high is not None:
+            shown = item_pool.get_items_by_price(low, high)
+            lines = len(shown)
+        else:
+            lines = item_pool.get_size()
+        if page is not None:
+            lines = min(lines, per_page)
+        if lines > ITEMS_CACHE_MAX_LINES:
+            return self.iter_items_lines(page, per_page, shown)
+        text = ''.join(self.iter_items_lines(page, per_page, shown))
+        if len(self._items_cache) > ITEMS_CACHE_SIZE:
+            # drop the oldest query (the first key is the owner)
+            del self._items_cache[list(self._items_cache)[1]]
+        self._items_cache[key] = text
+        return text
+
+    def process_ask(self, cmd=None):
         '''processes ask'''
+        if not len(self.app_engine.shopping_list):
+            self.app_engine.message = EMPTY_LIST_MESSAGE
+            return
         question = random.randint(0, len(self.app_engine.shopping_list.list))
         self.app_engine.message = self.show_list(mask_index=question)
         if question < len(self.app_engine.shopping_list.list):
@@ -104,27 +286,183 @@ class AppCLI:
 
     def process_show(self, cmd):
         '''process show'''
-        what = cmd[5:]
-        if what == 'items':
-            self.app_engine.message = self.show_items()
-        elif what == 'list':
+        what, *options = cmd[5:].split(' --')
+        if what == 'items' or what.startswith('items '):
+            try:
+                page, per_page = parse_page_options(options)
+                low, high = parse_price_range(what[6:])
+            except ValueError:
+                self.app_engine.message = 'Usage: show items ' \
+                    '[from <price> to <price>|under <price>] ' \
+                    '[--page <n>] [--per-page <m>]'
+                return
+            self.app_engine.message = self.get_items_render(page, per_page,
+                                                            low, high)
+        elif what == 'list' and not options:
+            if not len(self.app_engine.shopping_list):
+                self.app_engine.message = EMPTY_LIST_MESSAGE
+                return
             self.app_engine.message = self.show_list()
         else:
-            self.app_engine.message = f'Cannot show {what}.\n'
+            self.app_engine.message = f'Cannot show {cmd[5:]}.\n'
             self.app_engine.message += 'Usage: show list|items'
 
+    def process_find(self, cmd):
+        '''process find, "find <text>" lists names starting with or
+        similar to text'''
+        text = cmd[5:].strip()
+        if not text:
+            self.app_engine.message = 'Usage: find <text>'
+            return
+        item_pool = self.app_engine.items.snapshot()
+        names = item_pool.find_names(text, FIND_LIMIT)
+        if not names:
+            self.app_engine.message = f'No items match "{text}".'
+            return
+        self.app_engine.message = self.show_items(
+            shown=[item_pool.items[name] for name in names])
+
+    def process_profile(self, cmd):
+        '''process profile, "profile on|off"'''
+        switch = cmd[8:]
+        if switch == 'on':
+            self.start_profiling()
+            self.app_engine.message = 'Profiling on, reports go to ' \
+                f'{self.profile_dir}/ when it is turned off.'
+        elif switch == 'off' and self.profiler is not None:
+            self.profiler = None
+            self.app_engine.message = 'Profiling off, reports written ' \
+                f'to {self.profile_dir}/.'
+        elif switch == 'off':
+            self.app_engine.message = 'Profiling is not on.'
+        else:
+            self.app_engine.message = 'Usage: profile on|off'
+
+
+def parse_price_range(query):
+    '''parse "from A to B" or "under P" into (low, high)'''
+    words = query.split()
+    if not words:
+        return None, None
+    if len(words) == 4 and words[0] == 'from' and words[2] == 'to':
+        low, high = float(words[1]), float(words[3])
+    elif len(words) == 2 and words[0] == 'under':
+        low, high = None, float(words[1])
+    else:
+        raise ValueError(query)
+    return low, high
+
+
+def parse_page_options(options):
+    '''parse ["page N", "per-page M"] into (page, per_page)'''
+    page, per_page = None, None
+    for option in options:
+        key, _, value = option.partition(' ')
+        if key not in ('page', 'per-page') or not value.isdigit() \
+                or int(value) < 1:
+            raise ValueError(option)
+        if key == 'page':
+            page = int(value)
+        else:
+            per_page = int(value)
+    if per_page is not None and page is None:
+        page = 1
+    if page is not None and per_page is None:
+        per_page = DEFAULT_PER_PAGE
+    return page, per_page
+
+
+def parse_args(argv=None):
+    '''parse command line arguments'''
+    parser = argparse.ArgumentParser(description='Shopping list quiz.')
+    parser.add_argument('--catalog', metavar='FILE',
+                        help='load the item pool from a .csv or .jsonl file')
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help='open the item pool from a binary snapshot '
+                        '(edits are kept in memory)')
+    parser.add_argument('--script', metavar='FILE',
+                        help='run commands from FILE ("-" for stdin) '
+                        'without prompts')
+    parser.add_argument('--stats-file', metavar='FILE',
+                        help='write command stats to FILE in Prometheus '
+                        'text format')
+    parser.add_argument('--stats-interval', type=float, default=10.0,
+                        metavar='SECONDS',
+                        help='how often to write --stats-file')
+    parser.add_argument('--journal', metavar='DIR',
+                        help='keep the item pool in DIR (a snapshot plus a '
+                        'journal of changes), seeded from the other options '
+                        'the first time')
+    parser.add_argument('--sync', choices=SYNC_MODES, default=DEFAULT_SYNC,
+                        help='how --journal changes are made durable')
+    parser.add_argument('--sync-window', type=float, default=DEFAULT_WINDOW,
+                        metavar='SECONDS',
+                        help='fsync window of the group and async --sync '
+                        'modes')
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_DIR,
+                        metavar='DIR',
+                        help='profile every command, writing per command '
+                        f'reports to DIR (default {DEFAULT_PROFILE_DIR}) '
+                        'on exit')
+    return parser.parse_args(argv)
+
+
+def load_catalog(path):
+    '''load item pool from a catalog file, reporting rejected rows'''
+    rejected = []
+    item_pool = ItemPool.load(path, rejected=rejected)
+    for line_no, error in rejected[:10]:
+        print(f'{path}:{line_no}: {error}')
+    if rejected:
+        print(f'{len(rejected)} rows rejected, '
+              f'{item_pool.get_size()} items loaded.\n')
+    return item_pool
+
 
 if __name__ == '__main__':
-    # usage example
-    item2 = Item('Macbook', 1999.99)
-    item3 = Item('Milk', 4.25)
-    item4 = Item('Hotel Room', 255.00)
-    item5 = Item('Beef Steak', 25.18)
-    ip = ItemPool()
-    ip.add_item(item2)
-    ip.add_item(item3)
-    ip.add_item(item4)
-    ip.add_item(item5)
-    sp = ShoppingList(size=3, quantities=[3, 2, 4], item_pool=ip)
+    args = parse_args()
+    if args.snapshot:
+        ip = SnapshotItemPool(args.snapshot)
+        sp = ShoppingList()
+    elif args.catalog:
+        ip = load_catalog(args.catalog)
+        sp = ShoppingList(item_pool=ip) if ip.get_size() else ShoppingList()
+    else:
+        # usage example
+        item2 = Item('Macbook', 1999.99)
+        item3 = Item('Milk', 4.25)
+        item4 = Item('Hotel Room', 255.00)
+        item5 = Item('Beef Steak', 25.18)
+        ip = ItemPool()
+        ip.add_item(item2)
+        ip.add_item(item3)
+        ip.add_item(item4)
+        ip.add_item(item5)
+        sp = ShoppingList(size=3, quantities=[3, 2, 4], item_pool=ip)
+    if args.journal:
+        ip = JournaledItemPool(args.journal, ip, args.sync, args.sync_window)
+        sp = ShoppingList()
+    # suggestions in add/del/find start once the index is built
+    ip.build_name_index(wait=False)
     app = AppCLI(sp, ip)
-    app.run()
+    if args.profile:
+        app.profile_dir = args.profile
+        app.start_profiling()
+    stats_writer = None
+    if args.stats_file:
+        stats_writer = StatsWriter(app.app_engine.stats, args.stats_file,
+                                   args.stats_interval)
+        stats_writer.start()
+    if args.script == '-':
+        app.run_script(sys.stdin, sys.stdout)
+    elif args.script:
+        with open(args.script, encoding='utf-8') as script:
+            app.run_script(script, sys.stdout)
+    else:
+        app.run()
+    if app.profiler is not None:
+        app.profiler.finish()
+    if args.journal:
+        ip.close()
+    if stats_writer is not None:
+        stats_writer.stop()
@@ -0,0 +1,266 @@
+'''app server module
+
+Serves the shopping list quiz to many concurrent users over asyncio.
+The TCP protocol is line based: each line is a command, and each reply
+is the command's message followed by a single empty line. An optional
+HTTP endpoint accepts ``POST /command`` with the command as body and the
+session id in the ``X-Session`` header; a request without a known one
+starts a new session and gets its (random) id back in that header.
+HTTP sessions idle for ``http_timeout`` seconds are dropped.
+
+Every session has its own AppEngine state (shopping list, pending
+answer, message) while all sessions share one item pool, which is
+read-only unless the server is started with ``--writable``.
+'''
+import argparse
+import asyncio
+import io
+import itertools
+import secrets
+import time
+from collections import OrderedDict
+
+from shoppinglistapp.app_cli import AppCLI, get_error_message, load_catalog
+from shoppinglistapp.core import commands
+from shoppinglistapp.core.items import Item, ItemPool
+from shoppinglistapp.core.shoppinglist import ShoppingList
+
+READ_ONLY_MESSAGE = 'The item pool is read-only on this server.'
+MAX_LINE_LENGTH = 64 * 1024
+HTTP_SESSION_TIMEOUT = 30 * 60
+MAX_HTTP_SESSIONS = 10000
+
+
+class ServerSession(AppCLI):
+    '''one user session'''
+    def __init__(self, items, read_only=True):
+        super().__init__(ShoppingList(), items)
+        self.read_only = read_only
+        # profiling traces the whole server process and writes files
+        # into its working directory, so clients cannot turn it on
+        self.app_engine.handlers[commands.PROFILE] = \
+            self.app_engine.process_invalid
+
+    def execute_command(self, cmd):
+        '''execute command, refusing pool edits when read-only'''
+        if self.read_only and self.app_engine.correct_answer is None \
+                and cmd.startswith(('add', 'del')):
+            self.app_engine.message = READ_ONLY_MESSAGE
+            return
+        super().execute_command(cmd)
+
+    def reply(self, cmd):
+        '''execute a command and return the rendered reply
+
+        A command that raises gets an error reply, so that it does not
+        end the connection.
+        '''
+        out = io.StringIO()
+        try:
+            self.execute_command(cmd)
+            self.write_message(out)
+            text = out.getvalue()
+        except Exception as err:
+            text = get_error_message(cmd, err)
+        self.app_engine.message = None
+        # exactly one empty line ends a reply
+        text = text.rstrip('\n')
+        return f'{text}\n\n' if text else '\n'
+
+
+class AppServer:
+    '''asyncio front-end holding the sessions'''
+    def __init__(self, items, read_only=True,
+                 http_timeout=HTTP_SESSION_TIMEOUT):
+        self.items = items
+        self.read_only = read_only
+        self.http_timeout = http_timeout
+        # session id -> (session, last use), least recently used first
+        self.http_sessions = OrderedDict()
+        self.session_count = 0
+
+    def new_session(self):
+        '''create a session over the shared pool'''
+        self.session_count += 1
+        return ServerSession(self.items, self.read_only)
+
+    def get_http_session(self, session_id=None):
+        '''get the HTTP session with session_id, or start one under a
+        new random id (when session_id is None or unknown, so that
+        clients cannot pick ids); return the id and the session
+
+        Sessions idle for http_timeout seconds, and the least recently
+        used ones beyond MAX_HTTP_SESSIONS, are dropped first.
+        '''
+        now = time.monotonic()
+        sessions = self.http_sessions
+        while sessions:
+            _, (_, last_use) = next(iter(sessions.items()))
+            if len(sessions) < MAX_HTTP_SESSIONS and \
+                    now - last_use < self.http_timeout:
+                break
+            sessions.popitem(last=False)
+        if session_id in sessions:
+            session, _ = sessions.pop(session_id)
+        else:
+            session_id = secrets.token_hex(16)
+            session = self.new_session()
+        sessions[session_id] = session, now
+        return session_id, session
+
+    async def handle_tcp(self, reader, writer):
+        '''serve one line protocol connection'''
+        session = self.new_session()
+        try:
+            while session.app_engine.continue_execution:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd = line.decode('utf-8', 'replace').rstrip('\r\n')
+                writer.write(session.reply(cmd).encode('utf-8'))
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader, writer):
+        '''serve minimal HTTP/1.1 requests on one connection'''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = \
+                    request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get('content-length', 0)))
+                if method != 'POST' or target != '/command':
+                    status, text = '404 Not Found', 'Not found.\n'
+                    session_id = ''
+                else:
+                    session_id, session = self.get_http_session(
+                        headers.get('x-session') or None)
+                    text = session.reply(body.decode('utf-8', 'replace'))
+                    if not session.app_engine.continue_execution:
+                        del self.http_sessions[session_id]
+                    status = '200 OK'
+                payload = text.encode('utf-8')
+                writer.write(f'HTTP/1.1 {status}\r\n'
+                             'Content-Type: text/plain; charset=utf-8\r\n'
+                             f'Content-Length: {len(payload)}\r\n'
+                             f'X-Session: {session_id}\r\n\r\n'
+                             .encode('latin-1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765, http_port=None):
+        '''start the listeners, return the asyncio servers'''
+        servers = [await asyncio.start_server(self.handle_tcp, host, port,
+                                              limit=MAX_LINE_LENGTH)]
+        if http_port is not None:
+            servers.append(await asyncio.start_server(
+                self.handle_http, host, http_port, limit=MAX_LINE_LENGTH))
+        return servers
+
+
+async def run_load_test(host, port, clients=100, commands=100,
+                        mix=('list', 'show list', 'ask', '1.00')):
+    '''drive the TCP server with concurrent clients
+
+    Returns a dict with commands per second and latency percentiles
+    (in milliseconds).
+    '''
+    latencies = []
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        for cmd in itertools.islice(itertools.cycle(mix), commands):
+            start = time.perf_counter()
+            writer.write(cmd.encode('utf-8') + b'\n')
+            await writer.drain()
+            # a reply ends with an empty line
+            while (await reader.readline()) not in (b'\n', b''):
+                pass
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'clients': clients,
+        'commands': len(latencies),
+        'commands_per_sec': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def parse_args(argv=None):
+    '''parse command line arguments'''
+    parser = argparse.ArgumentParser(description='Shopping list server.')
+    parser.add_argument('--catalog', metavar='FILE',
+                        help='load the item pool from a .csv or .jsonl file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--http-port', type=int, default=None,
+                        help='also serve POST /command on this port')
+    parser.add_argument('--http-timeout', type=float,
+                        default=HTTP_SESSION_TIMEOUT,
+                        help='seconds before an idle HTTP session is dropped')
+    parser.add_argument('--writable', action='store_true',
+                        help='allow add/del on the shared item pool')
+    parser.add_argument('--load-test', action='store_true',
+                        help='run a local load test against the server')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--commands', type=int, default=100,
+                        help='commands per load test client')
+    return parser.parse_args(argv)
+
+
+def example_pool():
+    '''item pool used when no catalog is given'''
+    item_pool = ItemPool()
+    for name, price in [('Macbook', 1999.99), ('Milk', 4.25),
+                        ('Hotel Room', 255.00), ('Beef Steak', 25.18)]:
+        item_pool.add_item(Item(name, price))
+    return item_pool
+
+
+async def main(args):
+    '''run the server, or a load test against a local one'''
+    item_pool = load_catalog(args.catalog) if args.catalog else example_pool()
+    item_pool.build_name_index(wait=False)
+    server = AppServer(item_pool, read_only=not args.writable,
+                       http_timeout=args.http_timeout)
+    servers = await server.start(args.host, args.port, args.http_port)
+    if args.load_test:
+        result = await run_load_test(args.host, args.port, args.clients,
+                                     args.commands)
+        for key, value in result.items():
+            print(f'{key}: {value:.2f}' if isinstance(value, float)
+                  else f'{key}: {value}')
+        for tcp_server in servers:
+            tcp_server.close()
+        return
+    print(f'Serving on {args.host}:{args.port}')
+    await asyncio.gather(*(tcp_server.serve_forever()
+                           for tcp_server in servers))
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,358 @@
+'''benchmarks module
+
+Times the core hot paths at growing pool sizes.
+
+    python -m shoppinglistapp.benchmarks run --output baseline.json
+    python -m shoppinglistapp.benchmarks compare baseline.json \
+        --threshold 0.25 --threshold show_items=0.5
+    python -m shoppinglistapp.benchmarks concurrency --threads 1,2,4,8
+    python -m shoppinglistapp.benchmarks durability --threads 1,8
+
+``run`` prints and optionally saves seconds per operation for every
+benchmark and pool size. ``concurrency`` measures ConcurrentItemPool
+read throughput for several reader thread counts while a writer thread
+keeps adding and removing items. ``durability`` measures add/del
+throughput of a JournaledItemPool under each sync mode and writer
+thread count. ``compare`` reruns the sizes found in the
+baseline and exits with status 1 if any benchmark got slower than its
+threshold (a ratio, 0.25 meaning 25% slower).
+'''
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from shoppinglistapp.app_cli import AppCLI
+from shoppinglistapp.core.concurrentitems import ConcurrentItemPool
+from shoppinglistapp.core.items import Item, ItemPool
+from shoppinglistapp.core.journal import DEFAULT_WINDOW, SYNC_MODES, \
+    JournaledItemPool
+from shoppinglistapp.core.shoppinglist import ShoppingList
+
+DEFAULT_SIZES = (10**2, 10**3, 10**4, 10**5, 10**6)
+DEFAULT_THRESHOLD = 0.25
+LIST_SIZE = 10
+# stop repeating a benchmark once this much time was spent on it
+TIME_BUDGET = 0.2
+
+
+def make_items(n, prefix='item'):
+    '''make n distinct items with varied prices'''
+    rng = random.Random(n)
+    return [Item(f'{prefix}{i:07d}', round(rng.uniform(0.01, 9999.99), 2))
+            for i in range(n)]
+
+
+def make_pool(n):
+    '''make a pool of n items'''
+    item_pool = ItemPool()
+    item_pool.add_items(make_items(n))
+    return item_pool
+
+
+def make_app(n):
+    '''make an AppCLI over a pool of n items with a short list'''
+    item_pool = make_pool(n)
+    shopping_list = ShoppingList(size=min(LIST_SIZE, n), item_pool=item_pool)
+    return AppCLI(shopping_list, item_pool)
+
+
+def time_per_op(func, number):
+    '''best seconds per call of func over a few repeats of number calls'''
+    best = float('inf')
+    spent = 0.0
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed / number)
+        spent += elapsed
+        if spent > TIME_BUDGET:
+            break
+    return best
+
+
+def bench_add_item(n):
+    '''ItemPool.add_item into a pool of n items'''
+    item_pool = make_pool(n)
+    new_items = iter(make_items(10000, prefix='new'))
+    return time_per_op(lambda: item_pool.add_item(next(new_items)), 1000)
+
+
+def bench_sample_items(n):
+    '''ItemPool.sample_items(LIST_SIZE)'''
+    item_pool = make_pool(n)
+    return time_per_op(lambda: item_pool.sample_items(LIST_SIZE), 1000)
+
+
+def bench_refresh(n):
+    '''ShoppingList.refresh with LIST_SIZE items'''
+    item_pool = make_pool(n)
+    shopping_list = ShoppingList()
+    size = min(LIST_SIZE, n)
+    return time_per_op(lambda: shopping_list.refresh(item_pool, size), 1000)
+
+
+def bench_get_total_price(n):
+    '''ShoppingList.get_total_price'''
+    app = make_app(n)
+    return time_per_op(app.app_engine.shopping_list.get_total_price, 10000)
+
+
+def bench_show_list(n):
+    '''AppCLI.show_list'''
+    app = make_app(n)
+    return time_per_op(app.show_list, 1000)
+
+
+def bench_show_items(n):
+    '''AppCLI.show_items over the whole pool'''
+    app = make_app(n)
+    return time_per_op(app.show_items, 1)
+
+
+def bench_process_add_item(n):
+    '''AppEngine.process_add_item'''
+    app = make_app(n)
+    # time the lookup of similar names, not the index build
+    app.app_engine.items.build_name_index()
+    counter = iter(range(10**7))
+    return time_per_op(lambda: app.app_engine.process_add_item(
+        f'add new{next(counter)}: 1.99'), 1000)
+
+
+BENCHMARKS = {
+    'add_item': bench_add_item,
+    'sample_items': bench_sample_items,
+    'refresh': bench_refresh,
+    'get_total_price': bench_get_total_price,
+    'show_list': bench_show_list,
+    'show_items': bench_show_items,
+    'process_add_item': bench_process_add_item,
+}
+
+
+def run(sizes, names=None, out=sys.stdout):
+    '''run benchmarks, return {name: {size: seconds per op}}'''
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = {}
+        for size in sizes:
+            seconds = BENCHMARKS[name](size)
+            results[name][str(size)] = seconds
+            out.write(f'{name:<18} n={size:<8} {seconds * 1e6:12.2f} us\n')
+            out.flush()
+    return results
+
+
+def compare(baseline, results, thresholds):
+    '''compare results to a baseline, return the regressions
+
+    Each regression is a ``(name, size, old, new, ratio)`` tuple.
+    '''
+    regressions = []
+    for name, by_size in results.items():
+        limit = thresholds.get(name, thresholds.get(None, DEFAULT_THRESHOLD))
+        for size, new in by_size.items():
+            old = baseline.get(name, {}).get(size)
+            if old and new / old > 1 + limit:
+                regressions.append((name, size, old, new, new / old))
+    return regressions
+
+
+def run_concurrency(thread_counts, size=10**4, duration=1.0,
+                    out=sys.stdout):
+    '''reads/sec on a ConcurrentItemPool with a concurrent writer
+
+    Each reader samples a list and reads a page of sorted names from a
+    snapshot; the writer adds and removes items for the whole run.
+    Returns {threads: {'reads_per_sec': ..., 'writes_per_sec': ...}}.
+    '''
+    results = {}
+    for threads in thread_counts:
+        item_pool = ConcurrentItemPool()
+        item_pool.add_items(make_items(size))
+        stop = threading.Event()
+        reads = [0] * threads
+        writes = [0]
+
+        def reader(slot):
+            count = 0
+            while not stop.is_set():
+                snapshot = item_pool.snapshot()
+                snapshot.sample_items(LIST_SIZE)
+                snapshot.get_sorted_names(0, 20)
+                count += 1
+            reads[slot] = count
+
+        def writer():
+            counter = 0
+            while not stop.is_set():
+                counter += 1
+                item = Item(f'new{counter}', 1.99)
+                item_pool.add_item(item)
+                item_pool.remove_item(item.name)
+                writes[0] += 2
+
+        workers = [threading.Thread(target=reader, args=(slot,))
+                   for slot in range(threads)]
+        workers.append(threading.Thread(target=writer))
+        for worker in workers:
+            worker.start()
+        time.sleep(duration)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        results[threads] = {'reads_per_sec': sum(reads) / duration,
+                            'writes_per_sec': writes[0] / duration}
+        out.write(f'threads={threads:<3} '
+                  f'{results[threads]["reads_per_sec"]:12.0f} reads/s '
+                  f'{results[threads]["writes_per_sec"]:10.0f} writes/s\n')
+        out.flush()
+    return results
+
+
+def run_durability(thread_counts, modes=SYNC_MODES, size=10**4,
+                   duration=1.0, window=DEFAULT_WINDOW, out=sys.stdout):
+    '''mutations/sec of a JournaledItemPool for each sync mode
+
+    Every writer thread adds and removes its own items for ``duration``
+    seconds, on a fresh journal directory (with compactions) per run.
+    Returns {mode: {threads: mutations per second}}.
+    '''
+    results = {}
+    for mode in modes:
+        results[mode] = {}
+        for threads in thread_counts:
+            with tempfile.TemporaryDirectory() as directory:
+                item_pool = JournaledItemPool(directory, make_pool(size),
+                                              mode, window)
+                stop = threading.Event()
+                writes = [0] * threads
+
+                def writer(slot):
+                    counter = 0
+                    while not stop.is_set():
+                        counter += 1
+                        item = Item(f'new{slot}-{counter}', 1.99)
+                        item_pool.add_item(item)
+                        item_pool.remove_item(item.name)
+                        writes[slot] += 2
+
+                workers = [threading.Thread(target=writer, args=(slot,))
+                           for slot in range(threads)]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                time.sleep(duration)
+                stop.set()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+                item_pool.close()
+            results[mode][threads] = sum(writes) / elapsed
+            out.write(f'sync={mode:<7} threads={threads:<3} '
+                      f'{results[mode][threads]:12.0f} mutations/s\n')
+            out.flush()
+    return results
+
+
+def parse_thresholds(values):
+    '''parse ["0.3", "show_items=0.5"] into {None: 0.3, "show_items": 0.5}'''
+    thresholds = {}
+    for value in values or ():
+        name, _, limit = value.rpartition('=')
+        thresholds[name or None] = float(limit)
+    return thresholds
+
+
+def parse_args(argv=None):
+    '''parse command line arguments'''
+    parser = argparse.ArgumentParser(description='Shopping list benchmarks.')
+    sub = parser.add_subparsers(dest='mode', required=True)
+    run_parser = sub.add_parser('run', help='run and print benchmarks')
+    run_parser.add_argument('--output', metavar='FILE',
+                            help='save results as a JSON baseline')
+    compare_parser = sub.add_parser('compare',
+                                    help='rerun and compare to a baseline')
+    compare_parser.add_argument('baseline', metavar='FILE')
+    compare_parser.add_argument('--threshold', action='append',
+                                metavar='[NAME=]RATIO',
+                                help='allowed slowdown, e.g. 0.25 or '
+                                'show_items=0.5 (repeatable)')
+    concurrency_parser = sub.add_parser(
+        'concurrency', help='reader throughput with a concurrent writer')
+    concurrency_parser.add_argument('--threads', default='1,2,4,8',
+                                    help='comma separated reader counts')
+    concurrency_parser.add_argument('--size', type=int, default=10**4,
+                                    help='pool size')
+    concurrency_parser.add_argument('--duration', type=float, default=1.0,
+                                    help='seconds per thread count')
+    durability_parser = sub.add_parser(
+        'durability', help='journaled mutation throughput per sync mode')
+    durability_parser.add_argument('--threads', default='1,8',
+                                   help='comma separated writer counts')
+    durability_parser.add_argument('--sync', action='append',
+                                   choices=SYNC_MODES,
+                                   help='only run this sync mode '
+                                   '(repeatable)')
+    durability_parser.add_argument('--window', type=float,
+                                   default=DEFAULT_WINDOW,
+                                   help='fsync window in seconds')
+    durability_parser.add_argument('--duration', type=float, default=1.0,
+                                   help='seconds per run')
+    for sub_parser in (run_parser, compare_parser):
+        sub_parser.add_argument('--sizes', default=None,
+                                help='comma separated pool sizes')
+        sub_parser.add_argument('--bench', action='append',
+                                choices=sorted(BENCHMARKS),
+                                help='only run this benchmark (repeatable)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    '''command line entry point'''
+    args = parse_args(argv)
+    if args.mode == 'concurrency':
+        run_concurrency([int(count) for count in args.threads.split(',')],
+                        args.size, args.duration)
+        return 0
+    if args.mode == 'durability':
+        run_durability([int(count) for count in args.threads.split(',')],
+                       args.sync or SYNC_MODES, duration=args.duration,
+                       window=args.window)
+        return 0
+    sizes = [int(size) for size in args.sizes.split(',')] \
+        if args.sizes else None
+    if args.mode == 'run':
+        results = run(sizes or DEFAULT_SIZES, args.bench)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump({'python': platform.python_version(),
+                           'platform': platform.platform(),
+                           'results': results}, file, indent=2)
+        return 0
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    if sizes is None:
+        sizes = sorted({int(size) for by_size in baseline.values()
+                        for size in by_size})
+    names = args.bench or [name for name in baseline if name in BENCHMARKS]
+    results = run(sizes, names)
+    regressions = compare(baseline, results,
+                          parse_thresholds(args.threshold))
+    for name, size, old, new, ratio in regressions:
+        print(f'REGRESSION {name} n={size}: {old * 1e6:.2f} us -> '
+              f'{new * 1e6:.2f} us ({ratio:.2f}x)')
+    if not regressions:
+        print('No regressions.')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,24 @@
 '''app engine'''
-from shoppinglistapp.core.items import Item
+from time import perf_counter
+
+from shoppinglistapp.core import commands
+from shoppinglistapp.core.errors import InvalidItemNameError, \
+    InvalidItemPriceError, NonExistingItemError, DuplicateItemError
+from shoppinglistapp.core.items import Item, check_batch
+from shoppinglistapp.core.stats import CommandStats
+
+BATCH_ERROR_MESSAGES = {
+    ValueError: 'usage is <item_name>: <item_price>',
+    InvalidItemNameError: 'Item name string cannot be empty.',
+    InvalidItemPriceError: 'price must be a positive number',
+    DuplicateItemError: 'Duplicate!',
+    NonExistingItemError: 'not present in the item pool',
+}
+
+
+def is_price_str(price):
+    '''check that a price argument has only digits and at most one dot'''
+    return price.replace('.', '', 1).isdecimal()
 
 
 class AppEngine:
@@ -11,6 +30,50 @@ class AppEngine:
         self.message = None
         self.correct_answer = None
         self.status = None
+        # error class of the failed command, set by handlers
+        self.error = None
+        self.stats = CommandStats()
+        self.handlers = {
+            commands.ANSWER: self.process_answer,
+            commands.QUIT: self.process_quit,
+            commands.ADD: self.process_add_item,
+            commands.DEL: self.process_del_item,
+            commands.ADD_MANY: self.process_add_many,
+            commands.DEL_MANY: self.process_del_many,
+            commands.INVALID: self.process_invalid,
+            commands.STATS: self.process_stats,
+        }
+
+    def execute(self, cmd):
+        '''route a command line to its handler'''
+        if self.correct_answer is not None:
+            command_type = commands.ANSWER
+        else:
+            command_type = commands.route(cmd)
+        self.error = None
+        start = perf_counter()
+        try:
+            self.handlers[command_type](cmd)
+        except Exception as err:
+            self.stats.record(command_type, perf_counter() - start,
+                              type(err).__name__)
+            raise
+        self.stats.record(command_type, perf_counter() - start,
+                          self.error and self.error.__name__)
+        return command_type
+
+    def process_quit(self, cmd=None):
+        '''process quit'''
+        self.continue_execution = False
+        self.message = 'Have a nice day!'
+
+    def process_invalid(self, cmd):
+        '''process invalid command'''
+        self.message = f'"{cmd}" is not a valid command.'
+
+    def process_stats(self, cmd=None):
+        '''process stats'''
+        self.message = self.stats.render()
 
     def process_answer(self, cmd):
         '''process answer'''
@@ -33,20 +96,34 @@ class AppEngine:
         item_tuple = item_str.split(': ')
         if len(item_tuple) == 2:
             name, price = item_tuple
-            if price.replace(".", "").isnumeric():
+            if is_price_str(price):
                 # validate price str has only numbers
                 price = float(price)
                 if name != '':  # validate name is not empty
-                    item = Item(name, price)
+                    try:
+                        item = Item(name, price)
+                    except InvalidItemPriceError:
+                        # e.g. "add Tea: 0", same message as add-many
+                        self.error = InvalidItemPriceError
+                        self.message = f'Cannot add "{name}": ' \
+                            f'{BATCH_ERROR_MESSAGES[InvalidItemPriceError]}.'
+                        return
                     if item.name in self.items.items:
                         # validate item added is not duplicate
+                        self.error = DuplicateItemError
                         self.message = 'Duplicate!'
                     else:
+                        similar = self.items.suggest_names(item.name)
                         self.items.add_item(item)
                         self.message = f'{item} added successfully.'
+                        if similar:
+                            self.message += '\nSimilar items already ' \
+                                f'in the pool: {", ".join(similar)}.'
                 else:
+                    self.error = InvalidItemNameError
                     self.message = 'Item name string cannot be empty.'
             else:
+                self.error = InvalidItemPriceError
                 if '-' in price:
                     price = price.strip('-')
                     self.message = f'The price argument \
@@ -68,4 +145,69 @@ class AppEngine:
             self.items.remove_item(item_name)
             self.message = f'{item_name} removed successfully.'
         else:
+            self.error = NonExistingItemError
             self.message = f'Item named "{item_name}" is not present in the item pool.'
+            suggestions = self.items.suggest_names(item_name)
+            if suggestions:
+                self.message += f'\nDid you mean: {", ".join(suggestions)}?'
+
+    def process_add_many(self, cmd):
+        '''process add-many, "add-many <name>: <price>; <name>: <price>..."'''
+        entries = [entry.strip() for entry in cmd[9:].split(';')
+                   if entry.strip()]
+        if not entries:
+            self.message = 'Usage: add-many <item_name>: <item_price>; ...'
+            return
+        operations, positions, failures = [], [], {}
+        for i, entry in enumerate(entries):
+            name, sep, price = entry.rpartition(': ')
+            try:
+                if not sep:
+                    raise ValueError(entry)
+                if not is_price_str(price):
+                    # same price syntax as add
+                    raise InvalidItemPriceError(price)
+                item = Item(name, float(price))
+            except ValueError:
+                failures[i] = ValueError
+                continue
+            except (InvalidItemNameError, InvalidItemPriceError) as err:
+                failures[i] = type(err)
+                continue
+            operations.append(('add', item))
+            positions.append(i)
+        self._apply_batch('added', entries, operations, positions, failures)
+
+    def process_del_many(self, cmd):
+        '''process del-many, "del-many <name>; <name>..."'''
+        names = [name.strip() for name in cmd[9:].split(';') if name.strip()]
+        if not names:
+            self.message = 'Usage: del-many <item_name>; <item_name>; ...'
+            return
+        self._apply_batch('removed', names, [('del', name) for name in names],
+                          range(len(names)), {})
+
+    def _apply_batch(self, verb, entries, operations, positions, failures):
+        '''apply (or only check, if parsing failed) a batch and summarize
+        it per entry'''
+        if failures:
+            results = check_batch(self.items, operations)
+        else:
+            results = self.items.apply_batch(operations)
+        errors = dict(failures)
+        for i, (_, error) in zip(positions, results):
+            if error is not None:
+                errors[i] = type(error)
+        lines = []
+        for i, entry in enumerate(entries):
+            if i in errors:
+                lines.append(f'- {entry}: {BATCH_ERROR_MESSAGES[errors[i]]}')
+            else:
+                lines.append(f'- {entry}: {verb}')
+        if errors:
+            self.error = errors[min(errors)]
+            self.message = f'Nothing {verb}, {len(errors)} of ' \
+                f'{len(entries)} entries failed:\n'
+        else:
+            self.message = f'{len(entries)} items {verb}:\n'
+        self.message += '\n'.join(lines)
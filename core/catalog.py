@@ -0,0 +1,83 @@
+'''catalog module'''
+import csv
+import json
+import os
+from itertools import islice
+
+from shoppinglistapp.core.errors import InvalidCatalogFormatError
+
+CATALOG_FIELDS = ('name', 'price')
+
+
+def get_catalog_format(path):
+    '''get catalog format from the file extension'''
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise InvalidCatalogFormatError(path)
+
+
+def read_rows(path, fmt=None):
+    '''read rows
+
+    Yields ``(line_no, name, price)`` tuples one at a time. Rows that
+    cannot be decoded are yielded with ``name`` set to None and the
+    decoding error as ``price``.
+    '''
+    fmt = fmt or get_catalog_format(path)
+    with open(path, newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            header = [col.strip().lower() for col in header]
+            if 'name' not in header or 'price' not in header:
+                raise InvalidCatalogFormatError(path)
+            name_col, price_col = header.index('name'), header.index('price')
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) <= max(name_col, price_col):
+                    yield reader.line_num, None, 'Missing name or price.'
+                    continue
+                yield reader.line_num, row[name_col], row[price_col]
+        else:
+            for line_no, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    yield line_no, row['name'], row['price']
+                except (ValueError, TypeError, KeyError) as err:
+                    yield line_no, None, f'Cannot decode row ({err}).'
+
+
+def read_chunks(path, chunk_size, fmt=None):
+    '''read rows in lists of at most chunk_size'''
+    rows = read_rows(path, fmt)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_rows(path, items, fmt=None):
+    '''write (name, price) pairs, return the number of rows written'''
+    fmt = fmt or get_catalog_format(path)
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if fmt == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(CATALOG_FIELDS)
+            for name, price in items:
+                writer.writerow((name, f'{price:.2f}'))
+                count += 1
+        else:
+            for name, price in items:
+                file.write(json.dumps({'name': name, 'price': price}) + '\n')
+                count += 1
+    return count
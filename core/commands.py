@@ -0,0 +1,57 @@
+'''commands module
+
+Dispatch table shared by AppEngine and AppCLI. A command line is mapped
+to a command type either by an exact match (``q``, ``ask``, ...) or by
+its leading keyword (``show ...``, ``add ...``, ``find ...``, ...); handlers
+are then looked up by command type.
+'''
+
+ANSWER = 'answer'
+QUIT = 'quit'
+ASK = 'ask'
+LIST = 'list'
+SHOW = 'show'
+ADD = 'add'
+DEL = 'del'
+ADD_MANY = 'add-many'
+DEL_MANY = 'del-many'
+FIND = 'find'
+PROFILE = 'profile'
+STATS = 'stats'
+INVALID = 'invalid'
+
+EXACT_COMMANDS = {
+    'q': QUIT,
+    'quit': QUIT,
+    'a': ASK,
+    'ask': ASK,
+    'l': LIST,
+    'list': LIST,
+    'stats': STATS,
+}
+
+PREFIX_COMMANDS = {
+    'add-many': ADD_MANY,
+    'del-many': DEL_MANY,
+    'show': SHOW,
+    'find': FIND,
+    'profile': PROFILE,
+    'add': ADD,
+    'del': DEL,
+}
+
+# prefix lengths to try, longest first
+_PREFIX_LENGTHS = sorted({len(prefix) for prefix in PREFIX_COMMANDS},
+                         reverse=True)
+
+
+def route(cmd):
+    '''get the command type of a command line'''
+    command_type = EXACT_COMMANDS.get(cmd)
+    if command_type is not None:
+        return command_type
+    for length in _PREFIX_LENGTHS:
+        command_type = PREFIX_COMMANDS.get(cmd[:length])
+        if command_type is not None:
+            return command_type
+    return INVALID
@@ -0,0 +1,113 @@
+'''concurrent item pool module'''
+import threading
+from contextlib import contextmanager
+
+from shoppinglistapp.core.items import ItemPool
+
+
+class ConcurrentItemPool:
+    '''thread-safe item pool with copy-on-write versions
+
+    Readers never lock: every read goes to the currently published
+    ItemPool, which is never modified once published, and ``snapshot``
+    hands out that version for multi-step reads (such as rendering
+    ``show items``). Writers serialize on a lock, apply their change to
+    a private copy and publish it with a single attribute assignment.
+    A write costs a copy of the pool, so group many changes in one
+    ``edit`` block.
+    '''
+    def __init__(self, items=None):
+        self._current = ItemPool(items)
+        self._write_lock = threading.Lock()
+        self.version = 0
+
+    @property
+    def items(self):
+        '''items of the current version (do not modify)'''
+        return self._current.items
+
+    def snapshot(self):
+        '''get the current immutable version'''
+        return self._current
+
+    @contextmanager
+    def edit(self):
+        '''edit a private copy, published when the block exits cleanly'''
+        with self._write_lock:
+            draft = self._current.copy()
+            yield draft
+            self._current = draft
+            self.version += 1
+
+    def add_item(self, item):
+        '''add item'''
+        with self.edit() as draft:
+            draft.add_item(item)
+
+    def add_items(self, items):
+        '''add many items in one version, return rejected items'''
+        with self.edit() as draft:
+            return draft.add_items(items)
+
+    def remove_item(self, item_name):
+        '''remove item'''
+        with self.edit() as draft:
+            draft.remove_item(item_name)
+
+    def apply_batch(self, operations):
+        '''apply add/del operations as one version, see
+        items.apply_batch'''
+        with self.edit() as draft:
+            return draft.apply_batch(operations)
+
+    def set_weight(self, item_name, weight):
+        '''set the sampling weight of an item'''
+        with self.edit() as draft:
+            draft.set_weight(item_name, weight)
+
+    def get_weight(self, item_name):
+        '''get the sampling weight of an item'''
+        return self._current.get_weight(item_name)
+
+    def get_size(self):
+        '''get size'''
+        return self._current.get_size()
+
+    def sample_items(self, sample_size, **options):
+        '''sample items'''
+        return self._current.sample_items(sample_size, **options)
+
+    def count_items(self, min_price=None, max_price=None, **options):
+        '''count items with min_price <= price <= max_price'''
+        return self._current.count_items(min_price, max_price, **options)
+
+    def get_sorted_names(self, start=0, stop=None):
+        '''get item names in sorted order, optionally a slice of them'''
+        return self._current.get_sorted_names(start, stop)
+
+    def get_items_by_price(self, low=None, high=None):
+        '''get items with low <= price <= high, sorted by price'''
+        return self._current.get_items_by_price(low, high)
+
+    def get_names_with_prefix(self, prefix, limit=None):
+        '''get sorted item names starting with prefix'''
+        return self._current.get_names_with_prefix(prefix, limit)
+
+    def build_name_index(self, wait=True):
+        '''build the name index now, instead of on first use'''
+        self._current.build_name_index(wait)
+
+    def find_names(self, text, limit=10):
+        '''find item names: prefix matches first, then similar names'''
+        return self._current.find_names(text, limit)
+
+    def suggest_names(self, name, limit=3):
+        '''get existing names close to name (but not name itself)'''
+        return self._current.suggest_names(name, limit)
+
+    def dump(self, path):
+        '''write the current version to a .csv or .jsonl catalog'''
+        return self._current.dump(path)
+
+    def __repr__(self):
+        return f'ConcurrentItemPool({self._current.items})'
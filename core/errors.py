@@ -44,3 +44,23 @@ class InvalidShoppingListSizeError(Exception):
     '''invalid shopping list size class'''
     def __init__(self):
         super().__init__('Invalid List Size!')
+
+
+class InvalidCatalogFormatError(Exception):
+    '''invalid catalog format class'''
+    def __init__(self, path):
+        super().__init__(f'Cannot read catalog "{path}" \
+                         (expected a .csv or .jsonl file).')
+
+
+class ChangedItemPoolError(Exception):
+    '''changed item pool class'''
+    def __init__(self):
+        super().__init__('The item pool changed since the batch \
+                         was generated.')
+
+
+class ReadOnlyItemPoolError(Exception):
+    '''read-only item pool class'''
+    def __init__(self):
+        super().__init__('This item pool is attached read-only.')
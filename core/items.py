@@ -1,25 +1,50 @@
 '''items module'''
 import math
 import random
+import sys
+from array import array
 
+from shoppinglistapp.core.catalog import read_chunks, write_rows
 from shoppinglistapp.core.errors import InvalidItemNameError, \
     InvalidItemPriceError, InvalidItemPoolError, \
     NonExistingItemError, DuplicateItemError
+from shoppinglistapp.core.nameindex import FIND_MIN_SCORE, \
+    SUGGEST_MIN_SCORE, NameIndex, merge_matches
+from shoppinglistapp.core.sampling import WeightTree, weighted_sample
+from shoppinglistapp.core.sortedlist import SortedList
+
+CATALOG_CHUNK_SIZE = 10000
 
 
 class Item:
     '''class item'''
+    __slots__ = ('name', '_price', '_order')
+
     def __init__(self, name, price):
         if (not isinstance(name, str)) or (not name):
             raise InvalidItemNameError(name)
-        self.name = name
-        if not isinstance(price, (float, int)) or not price > 0:
+        self.name = sys.intern(str(name))
+        if not isinstance(price, (float, int)) or \
+                not 0 < price < math.inf:
             raise InvalidItemPriceError(price)
         self.price = round(price, 2)
 
+    @property
+    def price(self):
+        '''price'''
+        return self._price
+
+    @price.setter
+    def price(self, price):
+        if not isinstance(price, (float, int)) or \
+                not 0 < price < math.inf:
+            raise InvalidItemPriceError(price)
+        self._price = price
+        self._order = math.floor(round(math.log(price, 10), 10))
+
     def get_order(self):
         '''get order'''
-        return math.floor(round(math.log(self.price, 10), 10))
+        return self._order
 
     def get_price_str(self, quantity=None, hide_price=False, order=None):
         '''get price str'''
@@ -52,9 +77,30 @@ class Item:
         return isinstance(other, Item) and \
             self.name == other.name and self.price == other.price
 
+    def __hash__(self):
+        return hash((self.name, self.price))
+
 
 class ItemPool:
-    '''item pool class'''
+    '''item pool class
+
+    Besides the ``items`` dict, the pool keeps item names and prices in
+    parallel arrays with a name -> slot index, so that sampling can draw
+    slot indices directly instead of copying the whole pool. It also
+    keeps the names sorted, and ``(price, name)`` pairs sorted, in
+    SortedLists for ordered listing and price range queries in
+    O(log n + k); adding or removing an item updates them in about
+    O(log n + BLOCK_SIZE).
+
+    ``version`` changes whenever items are added or removed.
+
+    Item weights (for weighted sampling) live in a WeightTree by slot,
+    which is only built the first time weights are used and then kept
+    up to date; every item starts with weight 1. The trigram name index
+    used by find_names and suggest_names is built in a background thread
+    on first use (or by build_name_index) and then kept up to date; until
+    it is ready they only return prefix matches.
+    '''
     def __init__(self, items=None):
         if not items:
             items = {}
@@ -64,6 +110,50 @@ class ItemPool:
             if (not isinstance(key, str)) or (not isinstance(val, Item)):
                 raise InvalidItemPoolError()
         self.items = items
+        self._names = []
+        self._prices = array('d')
+        self._index = {}
+        for key, val in items.items():
+            self._index[key] = len(self._names)
+            self._names.append(key)
+            self._prices.append(val.price)
+        self._sort_indexes()
+        self._weight_tree = None
+        self._name_index = NameIndex()
+        self.version = 0
+
+    def _append_slot(self, name, price):
+        '''append slot'''
+        self.version += 1
+        self._index[name] = len(self._names)
+        self._names.append(name)
+        self._prices.append(price)
+        self._sorted_names.add(name)
+        self._by_price.add((price, name))
+        if self._weight_tree is not None:
+            self._weight_tree.append(1.0)
+        self._name_index.add(name)
+
+    def _remove_slot(self, name):
+        '''remove slot by swapping it with the last one'''
+        self.version += 1
+        slot = self._index.pop(name)
+        self._sorted_names.remove(name)
+        self._by_price.remove((self._prices[slot], name))
+        self._name_index.remove(name)
+        last = len(self._names) - 1
+        if slot != last:
+            last_name = self._names[last]
+            self._names[slot] = last_name
+            self._prices[slot] = self._prices[last]
+            self._index[last_name] = slot
+            if self._weight_tree is not None:
+                self._weight_tree.update(slot,
+                                         self._weight_tree.weights[last])
+        self._names.pop()
+        self._prices.pop()
+        if self._weight_tree is not None:
+            self._weight_tree.pop()
 
     def add_item(self, item):
         '''add item'''
@@ -72,24 +162,326 @@ class ItemPool:
         if item.name in self.items:
             raise DuplicateItemError()
         self.items[item.name] = item
+        self._append_slot(item.name, item.price)
+
+    def _sort_indexes(self):
+        '''build the sorted name and price indexes from the slots'''
+        self._sorted_names = SortedList(self._names)
+        self._by_price = SortedList(zip(self._prices, self._names))
+
+    def add_items(self, items):
+        '''add many items at once
+
+        The whole batch is checked for duplicates (against the pool and
+        within the batch) in one pass. Invalid or duplicate entries are
+        skipped and returned as a list of ``(item, error)`` pairs.
+        '''
+        return self._add_items(items)
+
+    def _add_items(self, items, sort_indexes=True):
+        '''add_items; without sort_indexes the sorted indexes are left
+        stale, for load to build them once at the end'''
+        rejected = []
+        new_items = {}
+        for item in items:
+            if not isinstance(item, Item):
+                rejected.append((item, InvalidItemPoolError()))
+            elif item.name in self.items or item.name in new_items:
+                rejected.append((item, DuplicateItemError()))
+            else:
+                new_items[item.name] = item
+        if new_items:
+            self.version += 1
+        self.items.update(new_items)
+        start = len(self._names)
+        self._index.update((name, start + i)
+                           for i, name in enumerate(new_items))
+        self._names.extend(new_items)
+        self._prices.extend(item.price for item in new_items.values())
+        if sort_indexes:
+            self._sorted_names.update(new_items)
+            self._by_price.update((item.price, name)
+                                  for name, item in new_items.items())
+        if self._weight_tree is not None:
+            for _ in new_items:
+                self._weight_tree.append(1.0)
+        if self._name_index.started:
+            for name in new_items:
+                self._name_index.add(name)
+        return rejected
 
     def remove_item(self, item_name):
         '''remove item'''
         if item_name not in self.items:
             raise NonExistingItemError(item_name)
         del self.items[item_name]
+        self._remove_slot(item_name)
+
+    def apply_batch(self, operations):
+        '''apply add/del operations atomically, see apply_batch'''
+        return apply_batch(self, operations)
 
     def get_size(self):
         '''get size'''
-        return len(self.items)
+        return len(self._names)
+
+    def _get_weight_tree(self):
+        '''get the weight tree, building it on first use'''
+        if self._weight_tree is None:
+            self._weight_tree = WeightTree([1.0] * len(self._names))
+        return self._weight_tree
+
+    def set_weight(self, item_name, weight):
+        '''set the sampling weight of an item'''
+        if item_name not in self._index:
+            raise NonExistingItemError(item_name)
+        if not isinstance(weight, (float, int)) or not weight >= 0:
+            raise ValueError()
+        self._get_weight_tree().update(self._index[item_name], float(weight))
+
+    def get_weight(self, item_name):
+        '''get the sampling weight of an item'''
+        if item_name not in self._index:
+            raise NonExistingItemError(item_name)
+        if self._weight_tree is None:
+            return 1.0
+        return self._weight_tree.weights[self._index[item_name]]
+
+    def _get_price_range(self, low=None, high=None):
+        '''get the slice of _by_price with low <= price <= high'''
+        lo = 0 if low is None else self._by_price.bisect_left((low,))
+        hi = len(self._by_price) if high is None else \
+            self._by_price.bisect_right((math.nextafter(high, math.inf),))
+        return lo, max(lo, hi)
+
+    def count_items(self, min_price=None, max_price=None, weighted=False):
+        '''count items with min_price <= price <= max_price
+
+        With ``weighted`` only items with a positive weight are counted,
+        that is the most a weighted sample can return.
+        '''
+        if weighted and self._weight_tree is not None:
+            if min_price is None and max_price is None:
+                return self._weight_tree.positive
+            lo, hi = self._get_price_range(min_price, max_price)
+            weights = self._weight_tree.weights
+            return sum(1 for _, name in self._by_price.islice(lo, hi)
+                       if weights[self._index[name]] > 0)
+        lo, hi = self._get_price_range(min_price, max_price)
+        return hi - lo
 
-    def sample_items(self, sample_size):
-        '''sample items'''
-        return random.sample(list(self.items.values()),
-                             min(sample_size, len(self.items)))
+    def sample_items(self, sample_size, weighted=False, min_price=None,
+                     max_price=None):
+        '''sample items
+
+        With ``weighted`` items are drawn with probability proportional
+        to their weight, without replacement; ``min_price`` and
+        ``max_price`` restrict the draw to a price band.
+        '''
+        if min_price is None and max_price is None:
+            size = len(self._names)
+            if weighted:
+                slots = self._get_weight_tree().sample(sample_size)
+            else:
+                slots = random.sample(range(size), min(sample_size, size))
+            return [self.items[self._names[slot]] for slot in slots]
+        lo, hi = self._get_price_range(min_price, max_price)
+        if weighted:
+            names = [name for _, name in self._by_price.islice(lo, hi)]
+            weights = self._get_weight_tree().weights
+            names = weighted_sample(
+                names, [weights[self._index[name]] for name in names],
+                sample_size)
+        else:
+            positions = random.sample(range(lo, hi),
+                                      min(sample_size, hi - lo))
+            names = [self._by_price[pos][1] for pos in positions]
+        return [self.items[name] for name in names]
+
+    def copy(self):
+        '''copy the pool and its indexes (items are shared)'''
+        pool = ItemPool.__new__(ItemPool)
+        pool.items = dict(self.items)
+        pool._names = list(self._names)
+        pool._prices = array('d', self._prices)
+        pool._index = dict(self._index)
+        pool._sorted_names = self._sorted_names.copy()
+        pool._by_price = self._by_price.copy()
+        pool._weight_tree = None if self._weight_tree is None else \
+            self._weight_tree.copy()
+        pool._name_index = self._name_index.copy()
+        pool.version = self.version
+        return pool
+
+    def snapshot(self):
+        '''get a consistent read view of the pool (the pool itself)'''
+        return self
+
+    def get_sorted_names(self, start=0, stop=None):
+        '''get item names in sorted order, optionally a slice of them'''
+        return self._sorted_names[start:stop]
+
+    def get_slot_items(self, slots):
+        '''get the items at the given slots (see sample_items)'''
+        names = self._names
+        return [self.items[names[slot]] for slot in slots]
+
+    def get_items_by_price(self, low=None, high=None):
+        '''get items with low <= price <= high, sorted by price'''
+        lo, hi = self._get_price_range(low, high)
+        return [self.items[name]
+                for _, name in self._by_price.islice(lo, hi)]
+
+    def _get_name_index(self):
+        '''get the name index, starting its build on first use'''
+        if not self._name_index.started:
+            self._name_index.start(list(self._names))
+        return self._name_index
+
+    def build_name_index(self, wait=True):
+        '''build the name index now, instead of on first use'''
+        self._get_name_index()
+        if wait:
+            self._name_index.wait()
+
+    def get_names_with_prefix(self, prefix, limit=None):
+        '''get sorted item names starting with prefix'''
+        names = []
+        start = self._sorted_names.bisect_left(prefix)
+        for name in self._sorted_names.islice(start):
+            if not name.startswith(prefix) or \
+                    (limit is not None and len(names) >= limit):
+                break
+            names.append(name)
+        return names
+
+    def find_names(self, text, limit=10):
+        '''find item names: prefix matches first, then similar names'''
+        return merge_matches(
+            self.get_names_with_prefix(text, limit),
+            self._get_name_index().search(text, limit, FIND_MIN_SCORE),
+            limit)
+
+    def suggest_names(self, name, limit=3):
+        '''get existing names close to name (but not name itself)'''
+        names = self._get_name_index().search(name, limit + 1,
+                                              SUGGEST_MIN_SCORE)
+        return [other for other in names if other != name][:limit]
+
+    @classmethod
+    def load(cls, path, chunk_size=CATALOG_CHUNK_SIZE, rejected=None):
+        '''load a pool from a .csv or .jsonl catalog
+
+        The file is streamed in chunks of ``chunk_size`` rows. Bad rows do
+        not stop the import; if ``rejected`` is a list, a
+        ``(line_no, message)`` pair is appended to it for each of them.
+        '''
+        pool = cls()
+        for chunk in read_chunks(path, chunk_size):
+            items, line_nos = [], {}
+            for line_no, name, price in chunk:
+                if name is None:
+                    # undecodable row, the reader passes the reason as price
+                    if rejected is not None:
+                        rejected.append((line_no, price))
+                    continue
+                try:
+                    item = _parse_catalog_row(name, price)
+                except (InvalidItemNameError, InvalidItemPriceError) as err:
+                    if rejected is not None:
+                        rejected.append((line_no, str(err)))
+                    continue
+                items.append(item)
+                line_nos[id(item)] = line_no
+            for item, err in pool._add_items(items, sort_indexes=False):
+                if rejected is not None:
+                    rejected.append((line_nos[id(item)], str(err)))
+        # sorting once instead of merging every chunk keeps loading linear
+        pool._sort_indexes()
+        return pool
+
+    def dump(self, path):
+        '''write the pool to a .csv or .jsonl catalog'''
+        return write_rows(path, ((item.name, item.price)
+                                 for item in self.items.values()))
 
     def __repr__(self):
         return f'ItemPool({self.items})'
 
     def __eq__(self, other):
         return isinstance(other, ItemPool) and self.items == other.items
+
+
+def _parse_catalog_row(name, price):
+    '''build an item from a raw catalog row'''
+    if isinstance(price, str):
+        try:
+            price = float(price)
+        except ValueError:
+            raise InvalidItemPriceError(price) from None
+    if not isinstance(price, (float, int)) or not math.isfinite(price):
+        raise InvalidItemPriceError(price)
+    return Item(name, price)
+
+
+def check_batch(item_pool, operations):
+    '''validate a batch of operations against a pool in one pass
+
+    ``operations`` is a sequence of ``('add', item)`` and
+    ``('del', item_name)`` pairs, checked in order (so a batch may
+    delete an item and add it back). Returns one ``(name, error)`` pair
+    per operation, with ``error`` None for valid operations.
+    '''
+    present = {}
+    results = []
+    for operation, arg in operations:
+        if operation == 'add':
+            if not isinstance(arg, Item):
+                results.append((arg, InvalidItemPoolError()))
+                continue
+            name = arg.name
+            if present.get(name, name in item_pool.items):
+                results.append((name, DuplicateItemError()))
+                continue
+            present[name] = True
+        elif operation == 'del':
+            name = arg
+            if not present.get(name, name in item_pool.items):
+                results.append((name, NonExistingItemError(name)))
+                continue
+            present[name] = False
+        else:
+            raise ValueError(operation)
+        results.append((name, None))
+    return results
+
+
+def apply_batch(item_pool, operations):
+    '''validate, then apply a batch of operations all or nothing
+
+    Returns the ``check_batch`` results. If any operation is invalid
+    nothing is applied; if applying fails midway the operations already
+    applied are undone before the error is raised.
+    '''
+    operations = list(operations)
+    results = check_batch(item_pool, operations)
+    if any(error is not None for _, error in results):
+        return results
+    undo = []
+    try:
+        for operation, arg in operations:
+            if operation == 'add':
+                item_pool.add_item(arg)
+                undo.append(('del', arg.name))
+            else:
+                item = item_pool.items[arg]
+                item_pool.remove_item(arg)
+                undo.append(('add', item))
+    except Exception:
+        for operation, arg in reversed(undo):
+            if operation == 'add':
+                item_pool.add_item(arg)
+            else:
+                item_pool.remove_item(arg)
+        raise
+    return results
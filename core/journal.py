@@ -0,0 +1,347 @@
+'''journal module
+
+Write-ahead journal of item pool changes. A journal directory holds a
+snapshot of the pool (``items.slps``, see snapshot.py) and an append-only
+``journal.jsonl`` of the changes made since. Each line is one change
+set, a JSON list of ``["add", name, price]`` and ``["del", name]``
+operations, so a batch is replayed whole or not at all. Opening the
+directory loads the snapshot and replays the journal; every
+``compact_every`` change sets the pool is compacted into a new snapshot
+and the journal starts over.
+
+Sync modes, from safest to fastest:
+
+    always  fsync every change set before returning
+    group   return once an fsync covering the change set is done; one
+            fsync covers every change set written by then (waiting
+            ``window`` seconds first when other writers are active)
+    async   return right away, a background thread fsyncs every
+            ``window`` seconds (at most ``window`` of changes lost)
+    none    only flush to the OS
+'''
+import json
+import os
+import threading
+import time
+
+from shoppinglistapp.core.errors import InvalidItemPoolError, \
+    NonExistingItemError, DuplicateItemError
+from shoppinglistapp.core.items import Item, ItemPool, check_batch
+from shoppinglistapp.core.snapshot import SnapshotItemPool, write_snapshot
+
+SYNC_MODES = ('always', 'group', 'async', 'none')
+DEFAULT_SYNC = 'group'
+DEFAULT_WINDOW = 0.0005
+DEFAULT_COMPACT_EVERY = 10000
+JOURNAL_FILE = 'journal.jsonl'
+SNAPSHOT_FILE = 'items.slps'
+
+
+def read_journal(path):
+    '''read the change sets of a journal file
+
+    A torn last line (from a crash during a write) is cut off the file,
+    so that new change sets are not appended after it.
+    '''
+    change_sets = []
+    if not os.path.exists(path):
+        return change_sets
+    good_size = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError(line)
+                change_sets.append(json.loads(line))
+            except ValueError:
+                break
+            good_size += len(line)
+    if good_size != os.path.getsize(path):
+        with open(path, 'r+b') as file:
+            file.truncate(good_size)
+    return change_sets
+
+
+def replay(item_pool, change_sets):
+    '''apply journaled change sets to an ItemPool
+
+    Replay is idempotent (adds replace, dels of missing items are
+    skipped), so change sets already in the snapshot can be replayed
+    again after a crash during compaction.
+    '''
+    for change_set in change_sets:
+        for operation in change_set:
+            name = operation[1]
+            if name in item_pool.items:
+                item_pool.remove_item(name)
+            if operation[0] == 'add':
+                item_pool.add_item(Item(name, operation[2]))
+
+
+class Journal:
+    '''append-only journal file with batched fsyncs, see the sync modes'''
+    def __init__(self, path, sync=DEFAULT_SYNC, window=DEFAULT_WINDOW,
+                 records=0):
+        if sync not in SYNC_MODES:
+            raise ValueError(sync)
+        self.path = path
+        self.sync = sync
+        self.window = window
+        # change sets in the file
+        self.records = records
+        self._file = open(path, 'ab')
+        # guards writes and the counters; _sync_lock is held during fsync
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._durable_cond = threading.Condition()
+        self._written = 0
+        self._durable = 0
+        self._leader = False
+        self._flusher = None
+        self._stop = threading.Event()
+        if sync == 'async':
+            self._flusher = threading.Thread(target=self._flush_loop,
+                                             daemon=True)
+            self._flusher.start()
+
+    def append(self, change_set):
+        '''write a change set, return its sequence number for commit'''
+        line = json.dumps(change_set, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line.encode('utf-8'))
+            self._file.flush()
+            self._written += 1
+            self.records += 1
+            if self.sync == 'always':
+                os.fsync(self._file.fileno())
+                self._durable = self._written
+            return self._written
+
+    def commit(self, seq):
+        '''wait until change set seq is as durable as the sync mode asks'''
+        if self.sync != 'group':
+            return
+        with self._durable_cond:
+            while self._durable < seq:
+                if not self._leader:
+                    self._leader = True
+                    break
+                self._durable_cond.wait()
+            else:
+                return
+        # leader: if other writers are active, let them join the batch
+        # for up to window seconds, then fsync for all
+        try:
+            if self.window and self._written > seq:
+                time.sleep(self.window)
+            self._fsync()
+        finally:
+            with self._durable_cond:
+                self._leader = False
+                self._durable_cond.notify_all()
+
+    def _fsync(self):
+        '''fsync everything written so far'''
+        with self._sync_lock:
+            with self._lock:
+                target = self._written
+            if self._durable < target:
+                os.fsync(self._file.fileno())
+                with self._durable_cond:
+                    self._durable = max(self._durable, target)
+
+    def _flush_loop(self):
+        '''fsync every window seconds (async mode)'''
+        while not self._stop.wait(self.window):
+            self._fsync()
+
+    def truncate(self):
+        '''empty the journal (once its changes are in a snapshot)'''
+        with self._sync_lock, self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            os.fsync(self._file.fileno())
+            self.records = 0
+            with self._durable_cond:
+                self._durable = self._written
+
+    def close(self):
+        '''fsync and close the file'''
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._fsync()
+        self._file.close()
+
+
+class JournaledItemPool:
+    '''ItemPool whose changes are journaled to a directory
+
+    Changes are checked, written to the journal and applied under one
+    lock, then committed outside of it, so concurrent writers share
+    fsyncs in group mode; a change is only reported done once it is as
+    durable as the sync mode asks. ``item_pool`` seeds a new directory
+    and is ignored when the directory already holds a snapshot.
+    '''
+    def __init__(self, directory, item_pool=None, sync=DEFAULT_SYNC,
+                 window=DEFAULT_WINDOW, compact_every=DEFAULT_COMPACT_EVERY):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compact_every = compact_every
+        self._snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        journal_path = os.path.join(directory, JOURNAL_FILE)
+        self._pool = ItemPool()
+        if os.path.exists(self._snapshot_path):
+            snapshot = SnapshotItemPool(self._snapshot_path)
+            self._pool.add_items(snapshot.items.values())
+            snapshot.close()
+        else:
+            if item_pool is not None:
+                self._pool.add_items(item_pool.items.values())
+            write_snapshot(self._pool, self._snapshot_path, sync=True)
+        change_sets = read_journal(journal_path)
+        replay(self._pool, change_sets)
+        self.journal = Journal(journal_path, sync, window, len(change_sets))
+        self._lock = threading.Lock()
+
+    def _write(self, change_set, apply, *args):
+        '''journal a change set and apply it, with the lock held
+
+        Returns the journal sequence number to commit and the result of
+        apply.
+        '''
+        seq = self.journal.append(change_set)
+        result = apply(*args)
+        if self.journal.records >= self.compact_every:
+            self._compact()
+        return seq, result
+
+    def add_item(self, item):
+        '''add item'''
+        if not isinstance(item, Item):
+            raise InvalidItemPoolError()
+        with self._lock:
+            if item.name in self._pool.items:
+                raise DuplicateItemError()
+            seq, _ = self._write([['add', item.name, item.price]],
+                                 self._pool.add_item, item)
+        self.journal.commit(seq)
+
+    def add_items(self, items):
+        '''add many items as one change set, return rejected items'''
+        items = list(items)
+        with self._lock:
+            results = check_batch(self._pool, [('add', item)
+                                               for item in items])
+            accepted = [item for item, (_, error) in zip(items, results)
+                        if error is None]
+            if not accepted:
+                return [(item, error) for item, (_, error)
+                        in zip(items, results)]
+            seq, rejected = self._write(
+                [['add', item.name, item.price] for item in accepted],
+                self._pool.add_items, items)
+        self.journal.commit(seq)
+        return rejected
+
+    def remove_item(self, item_name):
+        '''remove item'''
+        with self._lock:
+            if item_name not in self._pool.items:
+                raise NonExistingItemError(item_name)
+            seq, _ = self._write([['del', item_name]],
+                                 self._pool.remove_item, item_name)
+        self.journal.commit(seq)
+
+    def apply_batch(self, operations):
+        '''apply add/del operations as one change set, see
+        items.apply_batch'''
+        operations = list(operations)
+        with self._lock:
+            results = check_batch(self._pool, operations)
+            if any(error is not None for _, error in results):
+                return results
+            seq, results = self._write(
+                [['add', arg.name, arg.price] if operation == 'add'
+                 else ['del', arg] for operation, arg in operations],
+                self._pool.apply_batch, operations)
+        self.journal.commit(seq)
+        return results
+
+    def _compact(self):
+        '''write the pool to the snapshot and empty the journal, with
+        the lock held'''
+        write_snapshot(self._pool, self._snapshot_path, sync=True)
+        self.journal.truncate()
+
+    def compact(self):
+        '''write the pool to the snapshot and empty the journal'''
+        with self._lock:
+            self._compact()
+
+    @property
+    def items(self):
+        '''name -> Item mapping'''
+        return self._pool.items
+
+    @property
+    def version(self):
+        '''version of the pool'''
+        return self._pool.version
+
+    def get_size(self):
+        '''get size'''
+        return self._pool.get_size()
+
+    def sample_items(self, sample_size, **options):
+        '''sample items'''
+        return self._pool.sample_items(sample_size, **options)
+
+    def count_items(self, min_price=None, max_price=None, **options):
+        '''count items with min_price <= price <= max_price'''
+        return self._pool.count_items(min_price, max_price, **options)
+
+    def snapshot(self):
+        '''get a read view of the pool'''
+        return self._pool.snapshot()
+
+    def get_sorted_names(self, start=0, stop=None):
+        '''get item names in sorted order, optionally a slice of them'''
+        return self._pool.get_sorted_names(start, stop)
+
+    def get_items_by_price(self, low=None, high=None):
+        '''get items with low <= price <= high, sorted by price'''
+        return self._pool.get_items_by_price(low, high)
+
+    def get_names_with_prefix(self, prefix, limit=None):
+        '''get sorted item names starting with prefix'''
+        return self._pool.get_names_with_prefix(prefix, limit)
+
+    def build_name_index(self, wait=True):
+        '''build the name index now, instead of on first use'''
+        self._pool.build_name_index(wait)
+
+    def find_names(self, text, limit=10):
+        '''find item names: prefix matches first, then similar names'''
+        return self._pool.find_names(text, limit)
+
+    def suggest_names(self, name, limit=3):
+        '''get existing names close to name (but not name itself)'''
+        return self._pool.suggest_names(name, limit)
+
+    def dump(self, path):
+        '''write the pool to a .csv or .jsonl catalog'''
+        return self._pool.dump(path)
+
+    def close(self):
+        '''make every change durable and close the journal'''
+        self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f'JournaledItemPool({self.directory!r})'
@@ -0,0 +1,83 @@
+'''knapsack module'''
+import random
+from bisect import bisect_right
+from time import perf_counter
+
+MAX_QUANTITY = 9
+TIME_LIMIT = 0.05
+
+
+class _Stop(Exception):
+    '''ends the search (exact total found or out of time)'''
+
+
+def solve_budget(cents, size, budget, time_limit=TIME_LIMIT, rng=random):
+    '''pick ``size`` distinct prices with quantities 1 to 9 for a total
+    as close to ``budget`` as possible without going over it
+
+    All amounts are integer cents. Returns ``(total, picks)`` with
+    ``picks`` a list of ``(index into cents, quantity)`` pairs, or None
+    when even the ``size`` cheapest prices cost more than the budget.
+
+    Depth-first branch and bound over the prices sorted ascending: a
+    branch is cut when its cheapest completion (next prices once each)
+    goes over the budget, or when its dearest completion (largest prices
+    nine times each) cannot beat the best total so far. The last price
+    of a list is found by bisection for each quantity. The search stops
+    on an exact total or after ``time_limit`` seconds, returning the
+    best list found (at worst the ``size`` cheapest prices once each).
+    '''
+    order = sorted(range(len(cents)), key=cents.__getitem__)
+    values = [cents[i] for i in order]
+    count = len(values)
+    if size < 1 or size > count:
+        return None
+    prefix = [0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+    if prefix[size] > budget:
+        return None
+    best_total = prefix[size]
+    best = [(j, 1) for j in range(size)]
+    quantities = list(range(1, MAX_QUANTITY + 1))
+    rng.shuffle(quantities)
+    deadline = perf_counter() + time_limit
+    picks = []
+    nodes = 0
+
+    def search(start, remaining, total):
+        nonlocal best_total, best, nodes
+        nodes += 1
+        if not nodes & 255 and perf_counter() > deadline:
+            raise _Stop()
+        room = budget - total
+        if remaining == 1:
+            for qnt in quantities:
+                j = bisect_right(values, room // qnt, start) - 1
+                if j >= start and total + qnt * values[j] > best_total:
+                    best_total = total + qnt * values[j]
+                    best = picks + [(j, qnt)]
+                    if best_total == budget:
+                        raise _Stop()
+            return
+        dearest = MAX_QUANTITY * (prefix[count] - prefix[count - remaining + 1])
+        for j in range(start, count - remaining + 1):
+            cheapest = prefix[j + remaining] - prefix[j + 1]
+            if values[j] + cheapest > room:
+                # prices only grow from here on
+                break
+            for qnt in quantities:
+                value = qnt * values[j]
+                if value + cheapest > room or \
+                        total + value + dearest <= best_total:
+                    continue
+                picks.append((j, qnt))
+                search(j + 1, remaining - 1, total + value)
+                picks.pop()
+
+    if best_total < budget:
+        try:
+            search(0, size, 0)
+        except _Stop:
+            pass
+    return best_total, [(order[j], qnt) for j, qnt in best]
@@ -0,0 +1,243 @@
+'''name index module'''
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from difflib import SequenceMatcher
+
+# postings longer than this are skipped once other trigrams gave
+# candidates, so very common trigrams do not turn a query into a scan
+MAX_POSTING = 5000
+FIND_MIN_SCORE = 0.5
+SUGGEST_MIN_SCORE = 0.75
+
+
+def get_trigrams(text):
+    '''case-insensitive trigrams of text, padded at both ends'''
+    padded = f'  {text.lower()} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def rank_names(text, names, limit, min_score):
+    '''names ordered by difflib similarity to text, best first, keeping
+    at most limit of those scoring at least min_score'''
+    lowered = text.lower()
+    scored = []
+    for name in names:
+        score = SequenceMatcher(None, lowered, name.lower()).ratio()
+        if score >= min_score:
+            scored.append((-score, name))
+    return [name for _, name in sorted(scored)[:limit]]
+
+
+class TrigramIndex:
+    '''trigram -> names index for fuzzy name lookup
+
+    Names get increasing ids and each posting is a sorted array of ids,
+    so the index stays compact, is cheap to copy and a name is removed
+    from a posting by bisection.
+    '''
+    def __init__(self, names=()):
+        self._names = {}
+        self._ids = {}
+        self._postings = {}
+        self._next_id = 0
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        '''index a name'''
+        if name in self._ids:
+            return
+        name_id = self._next_id
+        self._next_id += 1
+        self._names[name_id] = name
+        self._ids[name] = name_id
+        for gram in get_trigrams(name):
+            posting = self._postings.get(gram)
+            if posting is None:
+                self._postings[gram] = array('I', (name_id,))
+            else:
+                posting.append(name_id)
+
+    def remove(self, name):
+        '''drop a name from the index'''
+        name_id = self._ids.pop(name, None)
+        if name_id is None:
+            return
+        del self._names[name_id]
+        for gram in get_trigrams(name):
+            posting = self._postings[gram]
+            if len(posting) == 1:
+                del self._postings[gram]
+            else:
+                del posting[bisect_left(posting, name_id)]
+
+    def copy(self):
+        '''copy the index'''
+        index = TrigramIndex()
+        index._names = dict(self._names)
+        index._ids = dict(self._ids)
+        index._postings = {gram: posting[:]
+                           for gram, posting in self._postings.items()}
+        index._next_id = self._next_id
+        return index
+
+    def search(self, text, limit=10, min_score=FIND_MIN_SCORE):
+        '''names most similar to text, best first
+
+        Candidates sharing the most trigrams with text are ranked by
+        difflib similarity; only those scoring at least min_score are
+        returned.
+        '''
+        grams = sorted(get_trigrams(text),
+                       key=lambda gram: len(self._postings.get(gram, ())))
+        counts = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting or (len(posting) > MAX_POSTING and counts):
+                continue
+            counts.update(posting)
+        candidates = heapq.nlargest(limit * 10, counts.items(),
+                                    key=lambda pair: pair[1])
+        return rank_names(text, [self._names[name_id]
+                                 for name_id, _ in candidates],
+                          limit, min_score)
+
+
+class _Build:
+    '''a TrigramIndex built by a daemon thread'''
+    def __init__(self, names):
+        self.index = None
+        # NameIndex objects waiting for this build (copies share it)
+        self.users = 1
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, args=(names,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, names):
+        index = TrigramIndex()
+        for name in names:
+            if self._cancelled:
+                return
+            index.add(name)
+        self.index = index
+
+    def wait(self):
+        '''wait for the build to end'''
+        self._thread.join()
+
+    def cancel(self):
+        '''stop the build and wait for the thread'''
+        self._cancelled = True
+        self._thread.join()
+
+
+class NameIndex:
+    '''TrigramIndex of a pool's names, built in a background thread
+
+    Nothing is indexed until ``start`` is given the names to index,
+    which the build thread then reads (so they must not change under
+    it). Changes made while the build runs are queued and replayed once
+    it is done; until then ``search`` finds nothing, so lookups never
+    wait for a build. A copy taken during the build shares it.
+    '''
+    def __init__(self):
+        self._index = None
+        self._build = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        '''whether the index is built or being built'''
+        return self._index is not None or self._build is not None
+
+    @property
+    def ready(self):
+        '''whether the index is built'''
+        with self._lock:
+            return self._install() is not None
+
+    def start(self, names):
+        '''start building the index from names, unless already started'''
+        with self._lock:
+            if not self.started:
+                self._build = _Build(names)
+
+    def wait(self):
+        '''wait for a running build'''
+        build = self._build
+        if build is not None:
+            build.wait()
+
+    def close(self):
+        '''stop a running build'''
+        build = self._build
+        if build is not None:
+            build.cancel()
+
+    def _install(self):
+        '''the TrigramIndex (taking it over from a finished build and
+        replaying the queued changes), or None; call with the lock held'''
+        build = self._build
+        if build is not None and build.index is not None:
+            build.users -= 1
+            index = build.index if not build.users else build.index.copy()
+            for added, name in self._pending:
+                if added:
+                    index.add(name)
+                else:
+                    index.remove(name)
+            self._index, self._build, self._pending = index, None, []
+        return self._index
+
+    def _change(self, added, name):
+        '''apply or queue a change'''
+        if not self.started:
+            return
+        with self._lock:
+            index = self._install()
+            if index is None:
+                self._pending.append((added, name))
+            elif added:
+                index.add(name)
+            else:
+                index.remove(name)
+
+    def add(self, name):
+        '''index a name'''
+        self._change(True, name)
+
+    def remove(self, name):
+        '''drop a name from the index'''
+        self._change(False, name)
+
+    def copy(self):
+        '''copy the index, sharing a running build'''
+        other = NameIndex()
+        with self._lock:
+            index = self._install()
+            if index is not None:
+                other._index = index.copy()
+            elif self._build is not None:
+                self._build.users += 1
+                other._build = self._build
+                other._pending = list(self._pending)
+        return other
+
+    def search(self, text, limit=10, min_score=FIND_MIN_SCORE):
+        '''names most similar to text, best first; none until built'''
+        with self._lock:
+            index = self._install()
+        if index is None:
+            return []
+        return index.search(text, limit, min_score)
+
+
+def merge_matches(prefix_names, fuzzy_names, limit):
+    '''prefix matches first, then fuzzy ones, without repeats'''
+    matches = list(dict.fromkeys(list(prefix_names) + list(fuzzy_names)))
+    return matches[:limit]
@@ -0,0 +1,75 @@
+'''batch pricing module
+
+Prices many shopping lists in one NumPy pass. Like the scalar methods,
+line prices come from the items held by the lists, not from a pool, so
+a list keeps the price an item had when it was drawn. NumPy is only
+needed by this module.
+'''
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def _require_numpy():
+    '''raise a helpful error when numpy is missing'''
+    if np is None:
+        raise ImportError('Batch pricing requires numpy '
+                          '(pip install numpy).')
+
+
+def get_price_vector(items):
+    '''get the prices of items as a vector of integer cents'''
+    _require_numpy()
+    prices = np.fromiter((item.price for item in items), dtype=np.float64,
+                         count=len(items))
+    return np.rint(prices * 100).astype(np.int64)
+
+
+def get_index_matrix(shopping_lists):
+    '''get padded (item index, quantity) matrices for the lists and the
+    distinct items they index
+
+    Items are told apart by name and price. Padding cells have index 0
+    and quantity 0, so they price to zero.
+    '''
+    _require_numpy()
+    width = max((len(shopping_list) for shopping_list in shopping_lists),
+                default=0)
+    indices = np.zeros((len(shopping_lists), width), dtype=np.int64)
+    quantities = np.zeros((len(shopping_lists), width), dtype=np.int64)
+    positions = {}
+    items = []
+    for row, shopping_list in enumerate(shopping_lists):
+        size = len(shopping_list.list)
+        if not size:
+            continue
+        row_indices = []
+        for item, _ in shopping_list.list:
+            key = (item.name, item.price)
+            position = positions.get(key)
+            if position is None:
+                position = positions[key] = len(items)
+                items.append(item)
+            row_indices.append(position)
+        indices[row, :size] = row_indices
+        quantities[row, :size] = [qnt for _, qnt in shopping_list.list]
+    return indices, quantities, items
+
+
+def price_lists_cents(shopping_lists):
+    '''price lists in cents, return (line_cents, total_cents)'''
+    indices, quantities, items = get_index_matrix(shopping_lists)
+    cents = get_price_vector(items)
+    line_cents = cents[indices] * quantities
+    return line_cents, line_cents.sum(axis=1)
+
+
+def price_lists(shopping_lists):
+    '''price lists, return (line_prices, totals)
+
+    ``line_prices[i, j]`` matches ``shopping_lists[i].get_item_price(j)``
+    and ``totals[i]`` matches ``shopping_lists[i].get_total_price()``.
+    '''
+    line_cents, total_cents = price_lists_cents(shopping_lists)
+    return line_cents / 100, total_cents / 100
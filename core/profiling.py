@@ -0,0 +1,158 @@
+'''profiling module'''
+import cProfile
+import os
+import pstats
+import tracemalloc
+
+# paths below this share (in microseconds) of their root are not
+# written to the collapsed stacks
+MIN_STACK_US = 1
+TOP_ALLOCATIONS = 10
+# the profilers' own allocations are left out of the reports
+_SNAPSHOT_FILTERS = [tracemalloc.Filter(False, module.__file__)
+                     for module in (cProfile, pstats, tracemalloc)] + \
+    [tracemalloc.Filter(False, __file__)]
+
+
+def _get_label(func):
+    '''flamegraph frame label of a pstats function key'''
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f'{os.path.basename(filename)}:{line}:{name}'
+
+
+def iter_collapsed_stacks(stats):
+    '''yield ``(stack, microseconds)`` pairs from pstats.Stats
+
+    cProfile only records caller -> callee edges, so time is split down
+    each edge in proportion to its share of the callee's cumulative
+    time; recursive calls are cut at their first repeat.
+    '''
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, (_, _, _, _, callers) in raw.items()
+             if not callers]
+
+    def walk(func, seconds, path, path_funcs):
+        _, _, tottime, cumtime, _ = raw[func]
+        if cumtime <= 0:
+            return
+        scale = seconds / cumtime
+        self_us = round(tottime * scale * 1e6)
+        if self_us >= MIN_STACK_US:
+            yield ';'.join(path), self_us
+        for callee, edge_cumtime in callees.get(func, ()):
+            if callee not in path_funcs:
+                yield from walk(callee, edge_cumtime * scale,
+                                path + [_get_label(callee)],
+                                path_funcs | {callee})
+
+    for root in roots:
+        yield from walk(root, raw[root][3], [_get_label(root)], {root})
+
+
+class CommandProfiler:
+    '''cProfile and tracemalloc profiles aggregated per command type
+
+    ``run`` executes one command under a fresh cProfile.Profile (merged
+    into the per type pstats.Stats afterwards) while tracemalloc records
+    how far traced memory peaks above its size at the start of the
+    call; for the call with the highest peak of each type the biggest
+    allocation sites are kept. ``write`` saves, per command type,
+    ``<type>.pstats``, ``<type>.collapsed`` (for flamegraph.pl or
+    speedscope) and ``<type>.memory.txt``.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.stats = {}
+        self.calls = {}
+        # command type -> highest and summed peak (calls counts them)
+        self.peak_max = {}
+        self.peak_sum = {}
+        self.top_allocations = {}
+        self._started_tracemalloc = False
+
+    def start(self):
+        '''start tracing allocations'''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self):
+        '''stop tracing allocations (if started here)'''
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def run(self, func, *args):
+        '''call func(*args) under the profilers, which must return the
+        command type to file the profile under'''
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_size = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            command_type = func(*args)
+        finally:
+            profile.disable()
+        peak = tracemalloc.get_traced_memory()[1] - start_size
+        if peak >= self.peak_max.get(command_type, 0):
+            diff = tracemalloc.take_snapshot().filter_traces(
+                _SNAPSHOT_FILTERS).compare_to(
+                    before.filter_traces(_SNAPSHOT_FILTERS), 'lineno')
+            self.top_allocations[command_type] = \
+                [str(stat) for stat in diff[:TOP_ALLOCATIONS]]
+        self.record(command_type, profile, peak)
+        return command_type
+
+    def record(self, command_type, profile, peak):
+        '''merge one call into the aggregates of command_type'''
+        stats = self.stats.get(command_type)
+        if stats is None:
+            self.stats[command_type] = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+        self.calls[command_type] = self.calls.get(command_type, 0) + 1
+        self.peak_max[command_type] = max(
+            self.peak_max.get(command_type, 0), peak)
+        self.peak_sum[command_type] = \
+            self.peak_sum.get(command_type, 0) + peak
+
+    def render_memory(self, command_type):
+        '''render the peak allocation report of a command type'''
+        calls = self.calls[command_type]
+        out = f'command: {command_type}\n'
+        out += f'calls: {calls}\n'
+        out += f'peak max: {self.peak_max[command_type] / 1024:.1f} KiB\n'
+        out += 'peak mean: ' \
+            f'{self.peak_sum[command_type] / calls / 1024:.1f} KiB\n'
+        out += 'top allocations of the call with the highest peak:\n'
+        for line in self.top_allocations[command_type]:
+            out += f'{line}\n'
+        return out
+
+    def finish(self):
+        '''stop tracing and write the reports'''
+        self.stop()
+        return self.write()
+
+    def write(self):
+        '''write the reports, return the paths written'''
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for command_type, stats in sorted(self.stats.items()):
+            base = os.path.join(self.directory, command_type)
+            stats.dump_stats(f'{base}.pstats')
+            with open(f'{base}.collapsed', 'w', encoding='utf-8') as file:
+                for stack, micros in iter_collapsed_stacks(stats):
+                    file.write(f'{stack} {micros}\n')
+            with open(f'{base}.memory.txt', 'w', encoding='utf-8') as file:
+                file.write(self.render_memory(command_type))
+            paths += [f'{base}.pstats', f'{base}.collapsed',
+                      f'{base}.memory.txt']
+        return paths
@@ -0,0 +1,124 @@
+'''sampling module'''
+import heapq
+import random
+
+
+class WeightTree:
+    '''Fenwick (binary indexed) tree of non-negative weights by slot
+
+    Supports appending a slot, changing a weight, removing the last slot
+    and finding the slot holding a given cumulative weight, all in
+    O(log n), so weighted draws stay fast on large pools. The number of
+    slots with a positive weight (the most a draw can return) is kept
+    as ``positive``.
+    '''
+    def __init__(self, weights=()):
+        self.weights = list(weights)
+        self.positive = sum(1 for weight in self.weights if weight > 0)
+        self._tree = [0.0] + self.weights
+        size = len(self._tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                self._tree[parent] += self._tree[i]
+
+    def copy(self):
+        '''copy the tree'''
+        tree = WeightTree.__new__(WeightTree)
+        tree.weights = list(self.weights)
+        tree.positive = self.positive
+        tree._tree = list(self._tree)
+        return tree
+
+    def __len__(self):
+        return len(self.weights)
+
+    def _prefix(self, stop):
+        '''sum of the first stop weights'''
+        total = 0.0
+        while stop > 0:
+            total += self._tree[stop]
+            stop -= stop & -stop
+        return total
+
+    def get_total(self):
+        '''sum of all weights'''
+        return self._prefix(len(self.weights))
+
+    def append(self, weight):
+        '''append a slot'''
+        self.weights.append(weight)
+        self.positive += weight > 0
+        i = len(self.weights)
+        self._tree.append(weight + self._prefix(i - 1) -
+                          self._prefix(i - (i & -i)))
+
+    def update(self, slot, weight):
+        '''set the weight of a slot'''
+        delta = weight - self.weights[slot]
+        self.positive += (weight > 0) - (self.weights[slot] > 0)
+        self.weights[slot] = weight
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def pop(self):
+        '''remove the last slot, return its weight'''
+        weight = self.weights[-1]
+        self.update(len(self.weights) - 1, 0.0)
+        self.weights.pop()
+        self._tree.pop()
+        return weight
+
+    def find(self, value):
+        '''get the slot whose cumulative weight range contains value'''
+        pos = 0
+        step = 1 << len(self._tree).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= value:
+                pos = nxt
+                value -= self._tree[nxt]
+            step >>= 1
+        return min(pos, len(self.weights) - 1)
+
+    def sample(self, k, rng=random):
+        '''draw up to k distinct slots with probability proportional to
+        weight (without replacement)
+
+        The tree is only read, so concurrent samplers are safe. Repeated
+        draws are rejected; if that happens too often (the drawn slots
+        hold most of the weight) the rest is drawn in one weighted pass
+        over all slots.
+        '''
+        total = self.get_total()
+        chosen = {}
+        misses = 0
+        while len(chosen) < k and total > 0:
+            slot = self.find(rng.random() * total)
+            if slot in chosen or self.weights[slot] <= 0:
+                misses += 1
+                if misses > 4 * k + 16:
+                    rest = weighted_sample(
+                        range(len(self.weights)),
+                        [0.0 if i in chosen else weight
+                         for i, weight in enumerate(self.weights)],
+                        k - len(chosen), rng)
+                    chosen.update(dict.fromkeys(rest))
+                    break
+                continue
+            chosen[slot] = None
+        return list(chosen)
+
+
+def weighted_sample(population, weights, k, rng=random):
+    '''draw up to k distinct elements, weighted, without replacement
+
+    Uses random sort keys ``u ** (1 / w)`` (Efraimidis-Spirakis) in a
+    single pass, for small candidate sets such as a price band.
+    '''
+    keyed = ((rng.random() ** (1.0 / weight), elem)
+             for elem, weight in zip(population, weights) if weight > 0)
+    return [elem for _, elem in heapq.nlargest(k, keyed,
+                                               key=lambda pair: pair[0])]
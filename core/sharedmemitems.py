@@ -0,0 +1,242 @@
+'''shared memory item pool module'''
+import struct
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+from shoppinglistapp.core.errors import InvalidItemPoolError, \
+    ReadOnlyItemPoolError
+from shoppinglistapp.core.items import ItemPool
+from shoppinglistapp.core.snapshot import Snapshot, SnapshotItemPool, \
+    encode_snapshot
+
+# control segment: magic, reserved, generation
+CONTROL = struct.Struct('<4sIQ')
+CONTROL_MAGIC = b'SLPC'
+
+
+def _open(name, create=False, size=0):
+    '''open a segment without resource tracking
+
+    Segments are removed explicitly by the writer. Before Python 3.13
+    even attaching registers a segment with the resource tracker, which
+    would then unlink it as soon as the attaching process exits.
+    '''
+    try:
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name, create, size)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _unlink(segment):
+    '''remove a segment opened by _open'''
+    if getattr(segment, '_track', True):
+        # before Python 3.13 unlink() also unregisters the segment
+        resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+
+
+def _release(name_index, snapshot, segment):
+    '''close the view of a generation and unmap its segment'''
+    name_index.close()
+    snapshot.close()
+    segment.close()
+
+
+class SharedItemPool:
+    '''item pool in shared memory, with one writer and many readers
+
+    Each generation of the pool is a snapshot (see snapshot.py) in its
+    own shared memory segment, ``<name>-<generation>``; the control
+    segment ``<name>`` holds the current generation. ``create`` makes
+    the writer, which applies changes to a private ItemPool and then
+    publishes them as a new generation (so batch them with add_items or
+    apply_batch). ``attach`` makes a read-only reader, which maps the new
+    generation on its next access once the counter has moved. Reads go
+    straight to the shared buffers in every process; ``version`` is the
+    generation, so caches keyed on it notice the writer's changes. An
+    older generation stays mapped as long as its view is still in use
+    (say by a reader streaming over a ``snapshot()``).
+
+    Only the writer removes segments, on close: segments of a writer that
+    was killed are left behind (under /dev/shm on Linux).
+    '''
+    def __init__(self, name, control, item_pool=None):
+        self.name = name
+        self._control = control
+        self._pool = item_pool
+        self._view = None
+        self._segment = None
+        # finalizers unmapping each generation once its view is unused
+        self._releases = []
+        self.generation = 0
+
+    @classmethod
+    def create(cls, name, item_pool=None):
+        '''create the pool (as its writer), publishing item_pool'''
+        if item_pool is None:
+            item_pool = ItemPool()
+        if not isinstance(item_pool, ItemPool):
+            raise InvalidItemPoolError()
+        control = _open(name, create=True, size=CONTROL.size)
+        pool = cls(name, control, item_pool.copy())
+        pool._publish()
+        return pool
+
+    @classmethod
+    def attach(cls, name):
+        '''attach to a pool created by another process, read-only'''
+        control = _open(name)
+        if bytes(control.buf[:4]) != CONTROL_MAGIC:
+            control.close()
+            raise InvalidItemPoolError()
+        return cls(name, control)
+
+    def _switch(self, segment, generation):
+        '''read from a new generation; the previous one is unmapped once
+        nothing uses its view anymore'''
+        snapshot = Snapshot.from_buffer(segment.buf, segment.name)
+        view = SnapshotItemPool(segment.name, snapshot)
+        self._releases = [release for release in self._releases
+                          if release.alive]
+        self._releases.append(weakref.finalize(
+            view, _release, view._name_index, snapshot, segment))
+        self._view, self._segment = view, segment
+        self.generation = generation
+
+    def _publish(self):
+        '''write the writer's pool as the next generation'''
+        generation = self.generation + 1
+        parts = encode_snapshot(self._pool)
+        segment = _open(f'{self.name}-{generation}', create=True,
+                        size=sum(len(part) for part in parts))
+        pos = 0
+        for part in parts:
+            segment.buf[pos:pos + len(part)] = part
+            pos += len(part)
+        CONTROL.pack_into(self._control.buf, 0, CONTROL_MAGIC, 0, generation)
+        if self._segment is not None:
+            # readers still mapping it keep it until they move on
+            _unlink(self._segment)
+        self._switch(segment, generation)
+
+    def _get_view(self):
+        '''the SnapshotItemPool over the current generation'''
+        if self._pool is None:
+            generation = CONTROL.unpack_from(self._control.buf)[2]
+            while generation != self.generation:
+                try:
+                    segment = _open(f'{self.name}-{generation}')
+                except FileNotFoundError:
+                    # already replaced by a newer generation
+                    generation = CONTROL.unpack_from(self._control.buf)[2]
+                    continue
+                self._switch(segment, generation)
+        return self._view
+
+    def _edit(self, method, *args):
+        '''call an ItemPool method on the writer's pool and publish the
+        change'''
+        if self._pool is None:
+            raise ReadOnlyItemPoolError()
+        version = self._pool.version
+        try:
+            return getattr(self._pool, method)(*args)
+        finally:
+            if self._pool.version != version:
+                self._publish()
+
+    @property
+    def items(self):
+        '''name -> Item mapping of the current generation'''
+        return self._get_view().items
+
+    @property
+    def version(self):
+        '''current generation'''
+        self._get_view()
+        return self.generation
+
+    def add_item(self, item):
+        '''add item'''
+        self._edit('add_item', item)
+
+    def add_items(self, items):
+        '''add many items in one generation, return rejected items'''
+        return self._edit('add_items', items)
+
+    def remove_item(self, item_name):
+        '''remove item'''
+        self._edit('remove_item', item_name)
+
+    def apply_batch(self, operations):
+        '''apply add/del operations as one generation, see
+        items.apply_batch'''
+        return self._edit('apply_batch', operations)
+
+    def snapshot(self):
+        '''get a consistent read view of the current generation'''
+        return self._get_view()
+
+    def get_size(self):
+        '''get size'''
+        return self._get_view().get_size()
+
+    def sample_items(self, sample_size, **options):
+        '''sample items'''
+        return self._get_view().sample_items(sample_size, **options)
+
+    def count_items(self, min_price=None, max_price=None, **options):
+        '''count items with min_price <= price <= max_price'''
+        return self._get_view().count_items(min_price, max_price, **options)
+
+    def get_sorted_names(self, start=0, stop=None):
+        '''get item names in sorted order, optionally a slice of them'''
+        return self._get_view().get_sorted_names(start, stop)
+
+    def get_items_by_price(self, low=None, high=None):
+        '''get items with low <= price <= high, sorted by price'''
+        return self._get_view().get_items_by_price(low, high)
+
+    def get_names_with_prefix(self, prefix, limit=None):
+        '''get sorted item names starting with prefix'''
+        return self._get_view().get_names_with_prefix(prefix, limit)
+
+    def build_name_index(self, wait=True):
+        '''build the name index now, instead of on first use'''
+        self._get_view().build_name_index(wait)
+
+    def find_names(self, text, limit=10):
+        '''find item names: prefix matches first, then similar names'''
+        return self._get_view().find_names(text, limit)
+
+    def suggest_names(self, name, limit=3):
+        '''get existing names close to name (but not name itself)'''
+        return self._get_view().suggest_names(name, limit)
+
+    def dump(self, path):
+        '''write the current generation to a .csv or .jsonl catalog'''
+        return self._get_view().dump(path)
+
+    def close(self):
+        '''detach, unmapping every generation (even views still in use);
+        the writer also removes the segments'''
+        if self._pool is not None and self._segment is not None:
+            _unlink(self._segment)
+            _unlink(self._control)
+        self._view = self._segment = None
+        for release in self._releases:
+            release()
+        self._releases = []
+        self._control.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        role = 'writer' if self._pool is not None else 'reader'
+        return f'SharedItemPool({self.name!r}, {role})'
@@ -1,25 +1,71 @@
 """shoppinglist module"""
 import random
-from shoppinglistapp.core.errors import InvalidShoppingListSizeError
+from array import array
+from collections import Counter
+from shoppinglistapp.core.errors import ChangedItemPoolError, \
+    InvalidItemPoolError, InvalidShoppingListSizeError
+from shoppinglistapp.core.items import ItemPool
+from shoppinglistapp.core.knapsack import TIME_LIMIT, solve_budget
+
+# items drawn as candidates for a budget list (at least 4 per line)
+BUDGET_CANDIDATES = 64
+# longest budget list drawn when no size is given
+BUDGET_MAX_SIZE = 9
 
 
 class ShoppingList:
-    """shoppinglist class"""
+    """shoppinglist class
+
+    The total (in integer cents), the longest item name and the largest
+    price order are kept up to date as lines are added or removed, so
+    they can be read without scanning the list. ``version`` changes
+    whenever the lines do, so renders can be cached.
+    """
     def __init__(self, size=None, quantities=None, item_pool=None):
         self.list = []
+        self.version = 0
+        self._reset_stats()
         if item_pool is not None:
             self.refresh(item_pool, size, quantities)
 
-    def refresh(self, item_pool, size=None, quantities=None):
-        '''refresh method'''
+    def refresh(self, item_pool, size=None, quantities=None, weighted=False,
+                min_price=None, max_price=None, quantity_weights=None,
+                budget=None, time_limit=TIME_LIMIT):
+        '''refresh method
+
+        ``weighted`` draws items by their pool weight, ``min_price`` and
+        ``max_price`` limit items to a price band and
+        ``quantity_weights`` (9 weights for quantities 1 to 9) skews the
+        random quantities. With ``budget`` the quantities are chosen
+        instead so that the total is the budget, or as close under it as
+        the solver gets within ``time_limit`` seconds.
+        '''
+        if budget is not None:
+            self._refresh_budget(item_pool, size, quantities, weighted,
+                                 min_price, max_price, budget, time_limit)
+            return
+        sample_options = {}
+        if min_price is not None or max_price is not None:
+            sample_options['min_price'] = min_price
+            sample_options['max_price'] = max_price
+        if weighted:
+            sample_options['weighted'] = True
+            # zero-weight items cannot be drawn
+            available = item_pool.count_items(min_price, max_price,
+                                              weighted=True)
+        elif sample_options:
+            available = item_pool.count_items(min_price, max_price)
+        else:
+            available = item_pool.get_size()
         if size is None:
-            size = random.randint(1, item_pool.get_size())
+            size = random.randint(1, available)
         if (not isinstance(size, int)) or (size < 1):
             raise ValueError()
-        if size > item_pool.get_size():
+        if size > available:
             raise InvalidShoppingListSizeError()
         if quantities is None:
-            quantities = random.choices(range(1, 10), k=size)
+            quantities = random.choices(range(1, 10), weights=quantity_weights,
+                                        k=size)
         if not isinstance(quantities, list):
             raise ValueError()
         for elem in quantities:
@@ -29,15 +75,177 @@ class ShoppingList:
             quantities = quantities + [1] * (size - len(quantities))
         if len(quantities) > size:
             quantities = quantities[:size]
-        items_list = item_pool.sample_items(size)
-        self.list = list(zip(items_list, quantities))
+        items_list = item_pool.sample_items(size, **sample_options)
+        self._set_lines(list(zip(items_list, quantities)))
         # [(item, q) for item, q in zip(items_list, /
         # quantities)]
 
+    def _refresh_budget(self, item_pool, size, quantities, weighted,
+                        min_price, max_price, budget, time_limit):
+        '''refresh with a total of (at most) budget, see refresh
+
+        Half of the candidates are drawn from the items priced under the
+        budget and half from those under its share per line (so that
+        ``size`` of them fit whenever the pool allows); solve_budget then
+        picks ``size`` of them and their quantities.
+        '''
+        if quantities is not None or \
+                not isinstance(budget, (float, int)) or not budget > 0:
+            raise ValueError()
+        if max_price is None or max_price > budget:
+            max_price = budget
+        options = {'weighted': True} if weighted else {}
+        available = item_pool.count_items(min_price, max_price, **options)
+        if not available:
+            # no item fits under the budget
+            raise InvalidShoppingListSizeError()
+        sizes = [size]
+        if size is None:
+            sizes = range(min(BUDGET_MAX_SIZE, available), 0, -1)
+            size = random.randint(1, len(sizes))
+            sizes = sizes[len(sizes) - size:]
+        elif (not isinstance(size, int)) or size < 1:
+            raise ValueError()
+        if not sizes or sizes[0] > available:
+            raise InvalidShoppingListSizeError()
+        budget_cents = round(budget * 100)
+        for size in sizes:
+            count = max(BUDGET_CANDIDATES, 4 * size) // 2
+            candidates = item_pool.sample_items(
+                count, min_price=min_price, max_price=max_price, **options)
+            shares = item_pool.sample_items(
+                count, min_price=min_price,
+                max_price=min(max_price, budget / size), **options)
+            candidates = list(dict.fromkeys(candidates + shares))
+            solution = solve_budget(
+                [round(item.price * 100) for item in candidates], size,
+                budget_cents, time_limit)
+            if solution is not None:
+                break
+        else:
+            raise InvalidShoppingListSizeError()
+        lines = [(candidates[i], qnt) for i, qnt in solution[1]]
+        random.shuffle(lines)
+        self._set_lines(lines)
+
+    def _set_lines(self, lines):
+        '''replace the list lines'''
+        self.list = lines
+        self.version += 1
+        self._reset_stats()
+        for item, qnt in self.list:
+            self._track(item, qnt)
+
+    @classmethod
+    def generate_many(cls, item_pool, n, size_range=None, seed=None):
+        '''generate n lists in one call
+
+        List ``i`` is drawn from its own ``random.Random`` stream seeded
+        from ``(seed, i)``, so a given list is reproducible on its own,
+        across processes and whatever ``n`` is. Sizes are drawn from the
+        inclusive ``size_range`` (by default 1 to the pool size) and
+        quantities from 1 to 9, as in ``refresh``.
+
+        Lists are drawn from ``item_pool.snapshot()``, which must be an
+        ItemPool (as it is for ItemPool, ConcurrentItemPool and
+        JournaledItemPool), since they are stored as its slots.
+        '''
+        item_pool = item_pool.snapshot()
+        if not isinstance(item_pool, ItemPool):
+            raise InvalidItemPoolError()
+        pool_size = item_pool.get_size()
+        if size_range is None:
+            size_range = (1, pool_size)
+        min_size, max_size = size_range
+        if (not isinstance(min_size, int)) or (not isinstance(max_size, int)) \
+                or min_size < 1 or min_size > max_size:
+            raise ValueError()
+        if max_size > pool_size:
+            raise InvalidShoppingListSizeError()
+        if (not isinstance(n, int)) or (n < 0):
+            raise ValueError()
+        if seed is None:
+            seed = random.getrandbits(64)
+        offsets = array('q', [0])
+        indices = array('q')
+        quantities = array('b')
+        population = range(pool_size)
+        qnt_range = range(1, 10)
+        for i in range(n):
+            rng = random.Random((seed << 32) + i)
+            size = rng.randint(min_size, max_size)
+            indices.extend(rng.sample(population, size))
+            quantities.extend(rng.choices(qnt_range, k=size))
+            offsets.append(len(indices))
+        return ShoppingListBatch(item_pool, offsets, indices, quantities)
+
+    def _reset_stats(self):
+        '''reset running stats'''
+        self._total_cents = 0
+        self._name_lens = Counter()
+        self._orders = Counter()
+        self._max_name_len = 0
+        self._max_order = 0
+
+    def _track(self, item, qnt):
+        '''account for a line added to the list'''
+        self._total_cents += round(item.price * 100) * qnt
+        name_len, order = len(item.name), item.get_order()
+        # the first tracked line sets the maxima (orders can be negative)
+        first = not self._orders
+        self._name_lens[name_len] += 1
+        self._orders[order] += 1
+        if first:
+            self._max_name_len, self._max_order = name_len, order
+        else:
+            self._max_name_len = max(self._max_name_len, name_len)
+            self._max_order = max(self._max_order, order)
+
+    def _untrack(self, item, qnt):
+        '''account for a line removed from the list'''
+        self._total_cents -= round(item.price * 100) * qnt
+        name_len, order = len(item.name), item.get_order()
+        self._name_lens[name_len] -= 1
+        if not self._name_lens[name_len]:
+            del self._name_lens[name_len]
+            if name_len == self._max_name_len:
+                self._max_name_len = max(self._name_lens, default=0)
+        self._orders[order] -= 1
+        if not self._orders[order]:
+            del self._orders[order]
+            if order == self._max_order:
+                self._max_order = max(self._orders, default=0)
+
+    def add_item(self, item, quantity=1):
+        '''add a line to the list'''
+        if (not isinstance(quantity, int)) or (quantity < 1):
+            raise ValueError()
+        self.list.append((item, quantity))
+        self.version += 1
+        self._track(item, quantity)
+
+    def remove_item(self, i):
+        '''remove the i-th line from the list'''
+        item, qnt = self.list.pop(i)
+        self.version += 1
+        self._untrack(item, qnt)
+        return item, qnt
+
+    def get_total_cents(self):
+        '''get total price in cents'''
+        return self._total_cents
+
     def get_total_price(self):
         '''get total price'''
-        return round(sum(item.price * qnt for (item, qnt) in self.list), 2)
-        # return round(sum([item.price * qnt for item, qnt in self.list]), 2)
+        return self._total_cents / 100
+
+    def get_max_name_len(self):
+        '''get length of the longest item name'''
+        return self._max_name_len
+
+    def get_max_order(self):
+        '''get largest item price order'''
+        return self._max_order
 
     def get_item_price(self, i):
         '''get total price'''
@@ -46,3 +254,40 @@ class ShoppingList:
     def __len__(self):
         '''len'''
         return len(self.list)
+
+
+class ShoppingListBatch:
+    """compact batch of generated shopping lists
+
+    List ``i`` is stored as item pool slot indices and quantities in
+    ``indices[offsets[i]:offsets[i + 1]]`` and the matching slice of
+    ``quantities``. Slots refer to the pool as it was when the batch was
+    generated (its ``version``): building a list once the pool changed
+    raises ChangedItemPoolError. ShoppingList objects are only built on
+    access.
+    """
+    def __init__(self, item_pool, offsets, indices, quantities):
+        self.item_pool = item_pool
+        self.version = item_pool.version
+        self.offsets = offsets
+        self.indices = indices
+        self.quantities = quantities
+
+    def __len__(self):
+        '''len'''
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        '''build the i-th shopping list'''
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self.item_pool.version != self.version:
+            raise ChangedItemPoolError()
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        items = self.item_pool.get_slot_items(self.indices[start:stop])
+        shopping_list = ShoppingList()
+        for item, qnt in zip(items, self.quantities[start:stop]):
+            shopping_list.add_item(item, qnt)
+        return shopping_list
@@ -0,0 +1,424 @@
+'''snapshot module
+
+Binary catalog snapshots that open in constant time through mmap.
+
+Layout (little-endian), records sorted by name:
+
+    header    magic b'SLPS', version u32, count u64, blob size u64
+    prices    count x f64
+    by_price  count x u64, record numbers sorted by (price, name)
+    offsets   (count + 1) x u64, name offsets into the blob
+    blob      utf-8 names
+'''
+import heapq
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from itertools import chain, islice
+
+from shoppinglistapp.core.catalog import write_rows
+from shoppinglistapp.core.errors import InvalidItemPoolError, \
+    NonExistingItemError, DuplicateItemError, InvalidCatalogFormatError
+from shoppinglistapp.core.items import Item, apply_batch
+from shoppinglistapp.core.nameindex import FIND_MIN_SCORE, \
+    SUGGEST_MIN_SCORE, NameIndex, merge_matches
+
+MAGIC = b'SLPS'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ')
+
+
+def _to_little_endian(values):
+    '''bytes of an array in little-endian order'''
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_snapshot(item_pool):
+    '''encode the items of a pool as a list of snapshot byte strings'''
+    names = sorted(item_pool.items)
+    items = item_pool.items
+    prices = array('d', (items[name].price for name in names))
+    by_price = array('Q', sorted(range(len(names)),
+                                 key=lambda i: (prices[i], names[i])))
+    encoded = [name.encode('utf-8') for name in names]
+    offsets = array('Q', [0])
+    for name in encoded:
+        offsets.append(offsets[-1] + len(name))
+    return [HEADER.pack(MAGIC, VERSION, len(names), offsets[-1]),
+            _to_little_endian(prices), _to_little_endian(by_price),
+            _to_little_endian(offsets), b''.join(encoded)]
+
+
+def write_snapshot(item_pool, path, sync=False):
+    '''write the items of a pool to a snapshot file
+
+    The file is written next to path and then moved over it, so a
+    snapshot that is currently mapped can be replaced safely. With
+    ``sync`` the file and the rename are fsynced, so the new snapshot
+    survives a crash.
+    '''
+    parts = encode_snapshot(item_pool)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        for part in parts:
+            file.write(part)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    if sync:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)),
+                         os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return HEADER.unpack(parts[0])[2]
+
+
+def _in_band(price, low, high):
+    '''whether low <= price <= high (None is no bound)'''
+    return (low is None or price >= low) and (high is None or price <= high)
+
+
+class Snapshot:
+    '''read-only zero-copy view over a snapshot file'''
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise InvalidCatalogFormatError(path)
+        with open(path, 'rb') as file:
+            try:
+                self._mmap = mmap.mmap(file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                raise InvalidCatalogFormatError(path) from None
+        self._load(self._mmap, path, exact=True)
+
+    @classmethod
+    def from_buffer(cls, buffer, name):
+        '''view over a snapshot already in memory (e.g. shared memory)
+
+        The buffer may be longer than the snapshot, as shared memory
+        segments can be rounded up to whole pages.
+        '''
+        if sys.byteorder != 'little':
+            raise InvalidCatalogFormatError(name)
+        snapshot = cls.__new__(cls)
+        snapshot._mmap = None
+        snapshot._load(buffer, name, exact=False)
+        return snapshot
+
+    def _load(self, buffer, path, exact):
+        '''check the header and set up the array views'''
+        if len(buffer) < HEADER.size:
+            raise InvalidCatalogFormatError(path)
+        magic, version, count, blob_size = HEADER.unpack_from(buffer)
+        size = HEADER.size + count * 8 * 3 + 8 + blob_size
+        if magic != MAGIC or version != VERSION or len(buffer) < size or \
+                (exact and len(buffer) != size):
+            raise InvalidCatalogFormatError(path)
+        self.count = count
+        self._view = view = memoryview(buffer)[:size]
+        pos = HEADER.size
+        self.prices = view[pos:pos + count * 8].cast('d')
+        pos += count * 8
+        self.by_price = view[pos:pos + count * 8].cast('Q')
+        pos += count * 8
+        self.offsets = view[pos:pos + (count + 1) * 8].cast('Q')
+        pos += (count + 1) * 8
+        self.blob = view[pos:]
+
+    def get_name(self, i):
+        '''name of record i'''
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def get_item(self, i):
+        '''build the item of record i'''
+        return Item(self.get_name(i), self.prices[i])
+
+    def find(self, name):
+        '''record number of name, or None'''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.get_name(lo) == name:
+            return lo
+        return None
+
+    def get_price_range(self, low=None, high=None):
+        '''positions in by_price with low <= price <= high'''
+        prices, by_price = self.prices, self.by_price
+        lo = 0 if low is None else bisect_left(
+            range(self.count), True, key=lambda i: prices[by_price[i]] >= low)
+        hi = self.count if high is None else bisect_left(
+            range(self.count), True, key=lambda i: prices[by_price[i]] > high)
+        return lo, max(lo, hi)
+
+    def close(self):
+        '''release the views and the mapping'''
+        for view in (self.prices, self.by_price, self.offsets, self.blob,
+                     self._view):
+            view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+
+class SnapshotItemMapping(Mapping):
+    '''name -> Item mapping over a snapshot plus the pool overlay'''
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __getitem__(self, name):
+        pool = self._pool
+        item = pool._added.get(name)
+        if item is not None:
+            return item
+        i = pool._snapshot.find(name)
+        if i is None or i in pool._deleted:
+            raise KeyError(name)
+        return pool._snapshot.get_item(i)
+
+    def __contains__(self, name):
+        pool = self._pool
+        if name in pool._added:
+            return True
+        i = pool._snapshot.find(name)
+        return i is not None and i not in pool._deleted
+
+    def __iter__(self):
+        return iter(self._pool.get_sorted_names())
+
+    def __len__(self):
+        return self._pool.get_size()
+
+    def values(self):
+        '''iterate items'''
+        return (self[name] for name in self)
+
+
+class SnapshotItemPool:
+    '''item pool view over a snapshot file
+
+    Opening does not depend on the catalog size: nothing is parsed up
+    front and Items are created on access. Edits go to an in-memory
+    overlay (added items and deleted record numbers) on top of the
+    read-only snapshot; write_snapshot(pool, path) persists them.
+    The trigram name index for find_names and suggest_names is built
+    from every live name, in a background thread started on first use
+    (or by build_name_index), so opening and editing never wait for it.
+    '''
+    def __init__(self, path, snapshot=None):
+        self.path = path
+        self._snapshot = Snapshot(path) if snapshot is None else snapshot
+        self._added = {}
+        self._added_names = []
+        self._added_index = {}
+        self._deleted = set()
+        self._name_index = NameIndex()
+        self.version = 0
+
+    @property
+    def items(self):
+        '''name -> Item mapping (made on access, so that the pool and
+        the mapping do not form a cycle and a pool goes away as soon as
+        it is unused)'''
+        return SnapshotItemMapping(self)
+
+    def add_item(self, item):
+        '''add item'''
+        if not isinstance(item, Item):
+            raise InvalidItemPoolError()
+        if item.name in self.items:
+            raise DuplicateItemError()
+        self._added[item.name] = item
+        self._added_index[item.name] = len(self._added_names)
+        self._added_names.append(item.name)
+        self.version += 1
+        self._name_index.add(item.name)
+
+    def remove_item(self, item_name):
+        '''remove item'''
+        if item_name in self._added:
+            del self._added[item_name]
+            slot = self._added_index.pop(item_name)
+            last_name = self._added_names.pop()
+            if last_name != item_name:
+                self._added_names[slot] = last_name
+                self._added_index[last_name] = slot
+        else:
+            i = self._snapshot.find(item_name)
+            if i is None or i in self._deleted:
+                raise NonExistingItemError(item_name)
+            self._deleted.add(i)
+        self.version += 1
+        self._name_index.remove(item_name)
+
+    def apply_batch(self, operations):
+        '''apply add/del operations atomically, see items.apply_batch'''
+        return apply_batch(self, operations)
+
+    def get_size(self):
+        '''get size'''
+        return self._snapshot.count - len(self._deleted) + len(self._added)
+
+    def sample_items(self, sample_size, weighted=False, min_price=None,
+                     max_price=None):
+        '''sample items
+
+        Draws record numbers over the snapshot and the overlay, skipping
+        deleted records; with min_price or max_price, draws positions in
+        the by-price order of the band and the added items in it instead.
+        Weights cannot be set on this pool, every item has weight 1, so
+        ``weighted`` draws are the same as unweighted ones.
+        '''
+        if min_price is not None or max_price is not None:
+            return self._sample_band(sample_size, min_price, max_price)
+        base = self._snapshot.count
+        total = base + len(self._added_names)
+        sample_size = min(sample_size, self.get_size())
+        chosen = set()
+        items = []
+        while len(items) < sample_size:
+            i = random.randrange(total)
+            if i in chosen or i in self._deleted:
+                continue
+            chosen.add(i)
+            if i < base:
+                items.append(self._snapshot.get_item(i))
+            else:
+                items.append(self._added[self._added_names[i - base]])
+        return items
+
+    def _sample_band(self, sample_size, low, high):
+        '''sample items with low <= price <= high'''
+        snapshot = self._snapshot
+        lo, hi = snapshot.get_price_range(low, high)
+        added = [item for item in self._added.values()
+                 if _in_band(item.price, low, high)]
+        base = hi - lo
+        sample_size = min(sample_size, self.count_items(low, high))
+        chosen = set()
+        items = []
+        while len(items) < sample_size:
+            pos = random.randrange(base + len(added))
+            if pos in chosen:
+                continue
+            chosen.add(pos)
+            if pos >= base:
+                items.append(added[pos - base])
+            elif snapshot.by_price[lo + pos] not in self._deleted:
+                items.append(snapshot.get_item(snapshot.by_price[lo + pos]))
+        return items
+
+    def snapshot(self):
+        '''get a consistent read view of the pool (the pool itself)'''
+        return self
+
+    def _iter_base_names(self):
+        '''names of the live snapshot records, sorted'''
+        snapshot = self._snapshot
+        return (snapshot.get_name(i) for i in range(snapshot.count)
+                if i not in self._deleted)
+
+    def get_sorted_names(self, start=0, stop=None):
+        '''get item names in sorted order, optionally a slice of them'''
+        if not self._added and not self._deleted:
+            stop = self._snapshot.count if stop is None else \
+                min(stop, self._snapshot.count)
+            return [self._snapshot.get_name(i) for i in range(start, stop)]
+        names = heapq.merge(self._iter_base_names(), sorted(self._added))
+        return list(islice(names, start, stop))
+
+    def get_items_by_price(self, low=None, high=None):
+        '''get items with low <= price <= high, sorted by price'''
+        snapshot = self._snapshot
+        lo, hi = snapshot.get_price_range(low, high)
+        base = (snapshot.get_item(snapshot.by_price[pos])
+                for pos in range(lo, hi)
+                if snapshot.by_price[pos] not in self._deleted)
+        added = sorted((item for item in self._added.values()
+                        if _in_band(item.price, low, high)),
+                       key=lambda item: (item.price, item.name))
+        return list(heapq.merge(base, added,
+                                key=lambda item: (item.price, item.name)))
+
+    def count_items(self, min_price=None, max_price=None, weighted=False):
+        '''count items with min_price <= price <= max_price (every item
+        has weight 1, so ``weighted`` changes nothing)'''
+        snapshot = self._snapshot
+        lo, hi = snapshot.get_price_range(min_price, max_price)
+        deleted = sum(_in_band(snapshot.prices[i], min_price, max_price)
+                      for i in self._deleted)
+        added = sum(_in_band(item.price, min_price, max_price)
+                    for item in self._added.values())
+        return hi - lo - deleted + added
+
+    def get_names_with_prefix(self, prefix, limit=None):
+        '''get sorted item names starting with prefix'''
+        snapshot = self._snapshot
+        start = bisect_left(range(snapshot.count), prefix,
+                            key=snapshot.get_name)
+        base = (snapshot.get_name(i) for i in range(start, snapshot.count)
+                if i not in self._deleted)
+        added = sorted(name for name in self._added
+                       if name.startswith(prefix))
+        names = []
+        for name in heapq.merge(base, added):
+            if not name.startswith(prefix) or \
+                    (limit is not None and len(names) >= limit):
+                break
+            names.append(name)
+        return names
+
+    def _get_name_index(self):
+        '''get the name index, starting its build on first use'''
+        if not self._name_index.started:
+            snapshot, deleted = self._snapshot, set(self._deleted)
+            base = (snapshot.get_name(i) for i in range(snapshot.count)
+                    if i not in deleted)
+            self._name_index.start(chain(list(self._added), base))
+        return self._name_index
+
+    def build_name_index(self, wait=True):
+        '''build the name index now, instead of on first use'''
+        self._get_name_index()
+        if wait:
+            self._name_index.wait()
+
+    def find_names(self, text, limit=10):
+        '''find item names: prefix matches first, then similar names'''
+        return merge_matches(
+            self.get_names_with_prefix(text, limit),
+            self._get_name_index().search(text, limit, FIND_MIN_SCORE),
+            limit)
+
+    def suggest_names(self, name, limit=3):
+        '''get existing names close to name (but not name itself)'''
+        names = self._get_name_index().search(name, limit + 1,
+                                              SUGGEST_MIN_SCORE)
+        return [other for other in names if other != name][:limit]
+
+    def dump(self, path):
+        '''write the pool to a .csv or .jsonl catalog'''
+        return write_rows(path, ((item.name, item.price)
+                                 for item in self.items.values()))
+
+    def close(self):
+        '''close the snapshot'''
+        self._name_index.close()
+        self._snapshot.close()
+
+    def __repr__(self):
+        return f'SnapshotItemPool({self.path!r})'
@@ -0,0 +1,133 @@
+'''sorted list module'''
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate, chain, islice
+
+# blocks are split once they hold twice this many values
+BLOCK_SIZE = 1000
+
+
+class SortedList:
+    '''list kept sorted in blocks of about BLOCK_SIZE values
+
+    Inserting or removing a value only shifts the values of one block
+    (and the block list), so both stay cheap on large lists instead of
+    O(n) like on one flat list. Positions are found through the block
+    offsets, which are recomputed on the first positional lookup after
+    a change.
+    '''
+    def __init__(self, values=()):
+        self._set(sorted(values))
+
+    def _set(self, values):
+        '''replace the contents with values, already sorted'''
+        self._blocks = [values[i:i + BLOCK_SIZE]
+                        for i in range(0, len(values), BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(values)
+        self._offsets = None
+
+    def copy(self):
+        '''copy the list'''
+        other = SortedList.__new__(SortedList)
+        other._blocks = [list(block) for block in self._blocks]
+        other._maxes = list(self._maxes)
+        other._len = self._len
+        other._offsets = self._offsets
+        return other
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+    def add(self, value):
+        '''insert a value'''
+        self._offsets = None
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            return
+        i = min(bisect_left(self._maxes, value), len(self._blocks) - 1)
+        block = self._blocks[i]
+        insort(block, value)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self._blocks.insert(i + 1, block[BLOCK_SIZE:])
+            del block[BLOCK_SIZE:]
+            self._maxes.insert(i, block[-1])
+
+    def update(self, values):
+        '''insert many values'''
+        values = list(values)
+        if len(values) * 8 < self._len:
+            for value in values:
+                self.add(value)
+        else:
+            # timsort merges the sorted run with the new values cheaply
+            self._set(sorted(chain(self, values)))
+
+    def remove(self, value):
+        '''remove a value, which must be in the list'''
+        i = bisect_left(self._maxes, value)
+        block = self._blocks[i]
+        del block[bisect_left(block, value)]
+        self._offsets = None
+        self._len -= 1
+        if block:
+            self._maxes[i] = block[-1]
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+
+    def _get_offsets(self):
+        '''position of the first value of each block'''
+        if self._offsets is None:
+            self._offsets = [0]
+            self._offsets += accumulate(map(len, self._blocks))
+        return self._offsets
+
+    def bisect_left(self, value):
+        '''position of the first value >= value'''
+        i = bisect_left(self._maxes, value)
+        if i == len(self._blocks):
+            return self._len
+        return self._get_offsets()[i] + bisect_left(self._blocks[i], value)
+
+    def bisect_right(self, value):
+        '''position of the first value > value'''
+        i = bisect_right(self._maxes, value)
+        if i == len(self._blocks):
+            return self._len
+        return self._get_offsets()[i] + bisect_right(self._blocks[i], value)
+
+    def islice(self, start=0, stop=None):
+        '''iterate over the values from position start to stop'''
+        stop = self._len if stop is None else min(stop, self._len)
+        if start >= stop:
+            return
+        offsets = self._get_offsets()
+        i = bisect_right(offsets, start) - 1
+        start -= offsets[i]
+        stop -= offsets[i]
+        for block in islice(self._blocks, i, None):
+            yield from block[start:stop]
+            stop -= len(block)
+            if stop <= 0:
+                return
+            start = 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None:
+                raise ValueError(index)
+            start, stop, _ = index.indices(self._len)
+            return list(self.islice(start, stop))
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        offsets = self._get_offsets()
+        i = bisect_right(offsets, index) - 1
+        return self._blocks[i][index - offsets[i]]
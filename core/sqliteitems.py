@@ -0,0 +1,330 @@
+'''sqlite item pool module'''
+import heapq
+import random
+import sqlite3
+from collections import Counter
+from collections.abc import Mapping
+
+from shoppinglistapp.core.catalog import write_rows
+from shoppinglistapp.core.errors import InvalidItemPoolError, \
+    NonExistingItemError, DuplicateItemError
+from shoppinglistapp.core.items import Item, check_batch
+from shoppinglistapp.core.nameindex import FIND_MIN_SCORE, MAX_POSTING, \
+    SUGGEST_MIN_SCORE, get_trigrams, merge_matches, rank_names
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    slot INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    price REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_price ON items (price, name);
+'''
+# trigram index of the names, padded like nameindex.get_trigrams and
+# kept up to date by triggers (the FTS5 rowid is the slot, which moves
+# on deletes)
+NAME_INDEX_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS item_names USING fts5 (
+    name, tokenize='trigram', detail='none', content=''
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS item_name_grams
+    USING fts5vocab (item_names, 'row');
+CREATE TRIGGER IF NOT EXISTS items_name_insert AFTER INSERT ON items BEGIN
+    INSERT INTO item_names (rowid, name)
+        VALUES (new.slot, '  ' || new.name || ' ');
+END;
+CREATE TRIGGER IF NOT EXISTS items_name_delete AFTER DELETE ON items BEGIN
+    INSERT INTO item_names (item_names, rowid, name)
+        VALUES ('delete', old.slot, '  ' || old.name || ' ');
+END;
+CREATE TRIGGER IF NOT EXISTS items_name_move AFTER UPDATE ON items BEGIN
+    INSERT INTO item_names (item_names, rowid, name)
+        VALUES ('delete', old.slot, '  ' || old.name || ' ');
+    INSERT INTO item_names (rowid, name)
+        VALUES (new.slot, '  ' || new.name || ' ');
+END;
+'''
+SQL_HAS_NAME_INDEX = "SELECT 1 FROM sqlite_master WHERE name = 'item_names'"
+SQL_BUILD_NAME_INDEX = 'INSERT INTO item_names (rowid, name) ' \
+    "SELECT slot, '  ' || name || ' ' FROM items"
+SQL_NAME_MATCH = 'SELECT rowid FROM item_names WHERE item_names MATCH ?'
+SQL_SIZE = 'SELECT COALESCE(MAX(slot) + 1, 0) FROM items'
+SQL_GET = 'SELECT name, price FROM items WHERE name = ?'
+SQL_GET_SLOT = 'SELECT slot FROM items WHERE name = ?'
+SQL_INSERT = 'INSERT INTO items (slot, name, price) VALUES (?, ?, ?)'
+SQL_DELETE = 'DELETE FROM items WHERE slot = ?'
+SQL_MOVE = 'UPDATE items SET slot = ? WHERE slot = ?'
+SQL_ALL = 'SELECT name, price FROM items'
+SQL_NAMES = 'SELECT name FROM items'
+SQL_SORTED_NAMES = 'SELECT name FROM items ORDER BY name LIMIT ? OFFSET ?'
+SQL_NAMES_FROM = 'SELECT name FROM items WHERE name >= ? ORDER BY name'
+SQL_BY_PRICE = 'SELECT name, price FROM items ' \
+    'WHERE price >= ? AND price <= ? ORDER BY price, name'
+SQL_BAND_SLOTS = 'SELECT slot FROM items WHERE price >= ? AND price <= ?'
+SQL_COUNT_BAND = 'SELECT COUNT(*) FROM items ' \
+    'WHERE price >= ? AND price <= ?'
+# keeps IN (...) well below SQLITE_MAX_VARIABLE_NUMBER
+SAMPLE_CHUNK_SIZE = 500
+
+
+def _price_bounds(low, high):
+    '''SQL bounds of a price band (None is no bound)'''
+    return (float('-inf') if low is None else low,
+            float('inf') if high is None else high)
+
+
+class SqliteItemMapping(Mapping):
+    '''read-only name -> Item mapping over the items table'''
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getitem__(self, name):
+        row = self._conn.execute(SQL_GET, (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return Item(*row)
+
+    def __contains__(self, name):
+        return self._conn.execute(SQL_GET_SLOT, (name,)).fetchone() \
+            is not None
+
+    def __iter__(self):
+        return (name for (name,) in self._conn.execute(SQL_NAMES))
+
+    def __len__(self):
+        return self._conn.execute(SQL_SIZE).fetchone()[0]
+
+    def values(self):
+        '''iterate items with a single query'''
+        return (Item(name, price)
+                for name, price in self._conn.execute(SQL_ALL))
+
+    def items(self):
+        '''iterate (name, item) pairs with a single query'''
+        return ((name, Item(name, price))
+                for name, price in self._conn.execute(SQL_ALL))
+
+
+class SqliteItemPool:
+    '''item pool stored in a sqlite database
+
+    Drop-in replacement for ItemPool that persists the pool. Rows keep a
+    dense ``slot`` primary key (deletes move the last row into the freed
+    slot), so sampling picks random slots instead of scanning the table.
+    One connection is opened per pool and used for all statements.
+    ``version`` counts changes made through this object only.
+    The trigram name index behind find_names and suggest_names is an
+    FTS5 table in the database, so it is built as items are written and
+    never loaded into memory. Without the FTS5 trigram tokenizer
+    (SQLite < 3.34) there are only prefix matches.
+    '''
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+        self._has_name_index = self._create_name_index()
+        self.items = SqliteItemMapping(self._conn)
+        self.version = 0
+
+    def _create_name_index(self):
+        '''create the name index (indexing the rows of a database made
+        without it), return False if SQLite cannot'''
+        existed = self._conn.execute(SQL_HAS_NAME_INDEX).fetchone()
+        try:
+            with self._conn:
+                self._conn.executescript(NAME_INDEX_SCHEMA)
+                if not existed:
+                    self._conn.execute(SQL_BUILD_NAME_INDEX)
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def add_item(self, item):
+        '''add item'''
+        if not isinstance(item, Item):
+            raise InvalidItemPoolError()
+        try:
+            with self._conn:
+                self._conn.execute(SQL_INSERT, (self.get_size(), item.name,
+                                                item.price))
+        except sqlite3.IntegrityError:
+            raise DuplicateItemError() from None
+        self.version += 1
+
+    def add_items(self, items):
+        '''add many items in one transaction, return rejected items'''
+        rejected = []
+        with self._conn:
+            size = self.get_size()
+            for item in items:
+                if not isinstance(item, Item):
+                    rejected.append((item, InvalidItemPoolError()))
+                    continue
+                try:
+                    self._conn.execute(SQL_INSERT,
+                                       (size, item.name, item.price))
+                except sqlite3.IntegrityError:
+                    rejected.append((item, DuplicateItemError()))
+                    continue
+                size += 1
+        self.version += 1
+        return rejected
+
+    def remove_item(self, item_name):
+        '''remove item'''
+        with self._conn:
+            row = self._conn.execute(SQL_GET_SLOT, (item_name,)).fetchone()
+            if row is None:
+                raise NonExistingItemError(item_name)
+            last = self.get_size() - 1
+            self._conn.execute(SQL_DELETE, (row[0],))
+            if row[0] != last:
+                self._conn.execute(SQL_MOVE, (row[0], last))
+        self.version += 1
+
+    def apply_batch(self, operations):
+        '''validate, then apply add/del operations in one transaction
+
+        Returns the ``check_batch`` results; nothing is written if any
+        operation is invalid or the transaction fails.
+        '''
+        operations = list(operations)
+        results = check_batch(self, operations)
+        if any(error is not None for _, error in results):
+            return results
+        with self._conn:
+            size = self.get_size()
+            for operation, arg in operations:
+                if operation == 'add':
+                    self._conn.execute(SQL_INSERT,
+                                       (size, arg.name, arg.price))
+                    size += 1
+                else:
+                    (slot,) = self._conn.execute(SQL_GET_SLOT,
+                                                 (arg,)).fetchone()
+                    size -= 1
+                    self._conn.execute(SQL_DELETE, (slot,))
+                    if slot != size:
+                        self._conn.execute(SQL_MOVE, (slot, size))
+        self.version += 1
+        return results
+
+    def get_size(self):
+        '''get size'''
+        return self._conn.execute(SQL_SIZE).fetchone()[0]
+
+    def sample_items(self, sample_size, weighted=False, min_price=None,
+                     max_price=None):
+        '''sample items, optionally only those with min_price <= price <=
+        max_price (every item has weight 1, so ``weighted`` changes
+        nothing)'''
+        if min_price is None and max_price is None:
+            population = range(self.get_size())
+        else:
+            population = [slot for (slot,) in self._conn.execute(
+                SQL_BAND_SLOTS, _price_bounds(min_price, max_price))]
+        slots = random.sample(population, min(sample_size, len(population)))
+        found = {}
+        for start in range(0, len(slots), SAMPLE_CHUNK_SIZE):
+            chunk = slots[start:start + SAMPLE_CHUNK_SIZE]
+            sql = 'SELECT slot, name, price FROM items WHERE slot IN ' \
+                f'({",".join("?" * len(chunk))})'
+            for slot, name, price in self._conn.execute(sql, chunk):
+                found[slot] = Item(name, price)
+        return [found[slot] for slot in slots]
+
+    def snapshot(self):
+        '''get a consistent read view of the pool (the pool itself)'''
+        return self
+
+    def get_sorted_names(self, start=0, stop=None):
+        '''get item names in sorted order, optionally a slice of them'''
+        limit = -1 if stop is None else max(stop - start, 0)
+        return [name for (name,) in
+                self._conn.execute(SQL_SORTED_NAMES, (limit, start))]
+
+    def get_items_by_price(self, low=None, high=None):
+        '''get items with low <= price <= high, sorted by price'''
+        return [Item(name, price) for name, price in self._conn.execute(
+            SQL_BY_PRICE, _price_bounds(low, high))]
+
+    def count_items(self, min_price=None, max_price=None, weighted=False):
+        '''count items with min_price <= price <= max_price (every item
+        has weight 1, so ``weighted`` changes nothing)'''
+        if min_price is None and max_price is None:
+            return self.get_size()
+        return self._conn.execute(
+            SQL_COUNT_BAND, _price_bounds(min_price, max_price)).fetchone()[0]
+
+    def get_names_with_prefix(self, prefix, limit=None):
+        '''get sorted item names starting with prefix'''
+        names = []
+        for (name,) in self._conn.execute(SQL_NAMES_FROM, (prefix,)):
+            if not name.startswith(prefix) or \
+                    (limit is not None and len(names) >= limit):
+                break
+            names.append(name)
+        return names
+
+    def _search_names(self, text, limit, min_score):
+        '''names most similar to text, best first (see
+        TrigramIndex.search)'''
+        if not self._has_name_index:
+            return []
+        grams = list(get_trigrams(text))
+        sql = 'SELECT term, doc FROM item_name_grams WHERE term IN ' \
+            f'({",".join("?" * len(grams))})'
+        docs = dict(self._conn.execute(sql, grams))
+        # count shared trigrams over the rarest ones, matching at most
+        # MAX_POSTING rows in all (or the rarest one), so that common
+        # trigrams do not turn a lookup into a scan
+        counts, rows = Counter(), 0
+        for gram in sorted(docs, key=docs.get):
+            rows += docs[gram]
+            if counts and rows > MAX_POSTING:
+                break
+            query = '"' + gram.replace('"', '""') + '"'
+            counts.update(slot for (slot,) in
+                          self._conn.execute(SQL_NAME_MATCH, (query,)))
+        slots = [slot for slot, _ in heapq.nlargest(
+            limit * 10, counts.items(), key=lambda pair: pair[1])]
+        sql = 'SELECT name FROM items WHERE slot IN ' \
+            f'({",".join("?" * len(slots))})'
+        names = [name for (name,) in self._conn.execute(sql, slots)]
+        return rank_names(text, names, limit, min_score)
+
+    def build_name_index(self, wait=True):
+        '''nothing to do, the name index is kept in the database'''
+
+    def find_names(self, text, limit=10):
+        '''find item names: prefix matches first, then similar names'''
+        return merge_matches(
+            self.get_names_with_prefix(text, limit),
+            self._search_names(text, limit, FIND_MIN_SCORE),
+            limit)
+
+    def suggest_names(self, name, limit=3):
+        '''get existing names close to name (but not name itself)'''
+        names = self._search_names(name, limit + 1, SUGGEST_MIN_SCORE)
+        return [other for other in names if other != name][:limit]
+
+    def dump(self, path):
+        '''write the pool to a .csv or .jsonl catalog'''
+        return write_rows(path, self._conn.execute(SQL_ALL))
+
+    def close(self):
+        '''close the connection'''
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f'SqliteItemPool({self.path!r})'
@@ -0,0 +1,128 @@
+'''stats module'''
+import os
+import threading
+from bisect import bisect_left
+
+# latency histogram upper bounds in seconds (1us .. 10s)
+LATENCY_BUCKETS = tuple(base * 10.0 ** exp for exp in range(-6, 1)
+                        for base in (1, 2, 5)) + (10.0,)
+METRIC_PREFIX = 'shoppinglist'
+
+
+class CommandStats:
+    '''per command type counters and latency histograms
+
+    ``record`` is called once per command and only does a few dict
+    updates and a bisect, so it can stay on in production.
+    '''
+    def __init__(self):
+        self.counts = {}
+        self.errors = {}
+        self.latency_sums = {}
+        self.histograms = {}
+
+    def record(self, command_type, seconds, error=None):
+        '''record one command'''
+        # counts gets a new command type last: render_prometheus runs on
+        # another thread and reads the other dicts for the types in counts
+        histogram = self.histograms.get(command_type)
+        if histogram is None:
+            histogram = self.histograms[command_type] = \
+                [0] * (len(LATENCY_BUCKETS) + 1)
+        histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sums[command_type] = \
+            self.latency_sums.get(command_type, 0.0) + seconds
+        counts = self.counts
+        counts[command_type] = counts.get(command_type, 0) + 1
+        if error is not None:
+            key = (command_type, error)
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def get_quantile(self, command_type, quantile):
+        '''get the bucket upper bound holding the given quantile'''
+        histogram = self.histograms[command_type]
+        rank = quantile * sum(histogram)
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),),
+                                histogram):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def render(self):
+        '''render a human readable table'''
+        out = f'{"COMMAND":<10} {"COUNT":>8} {"ERRORS":>7} ' \
+            f'{"MEAN(ms)":>9} {"P50(ms)":>8} {"P99(ms)":>8}\n'
+        for command_type in sorted(self.counts):
+            count = self.counts[command_type]
+            errors = sum(num for (cmd, _), num in self.errors.items()
+                         if cmd == command_type)
+            mean = self.latency_sums[command_type] / count
+            out += f'{command_type:<10} {count:>8} {errors:>7} ' \
+                f'{mean * 1000:>9.3f} ' \
+                f'{self.get_quantile(command_type, 0.5) * 1000:>8.3f} ' \
+                f'{self.get_quantile(command_type, 0.99) * 1000:>8.3f}\n'
+        for (command_type, error), count in sorted(self.errors.items()):
+            out += f'{command_type}: {error} x{count}\n'
+        return out
+
+    def render_prometheus(self):
+        '''render in the Prometheus text exposition format'''
+        counts = dict(self.counts)
+        errors = dict(self.errors)
+        lines = [f'# HELP {METRIC_PREFIX}_commands_total Commands executed.',
+                 f'# TYPE {METRIC_PREFIX}_commands_total counter']
+        for command_type, count in sorted(counts.items()):
+            lines.append(f'{METRIC_PREFIX}_commands_total'
+                         f'{{command="{command_type}"}} {count}')
+        lines += [f'# HELP {METRIC_PREFIX}_command_errors_total '
+                  'Commands that failed, by error class.',
+                  f'# TYPE {METRIC_PREFIX}_command_errors_total counter']
+        for (command_type, error), count in sorted(errors.items()):
+            lines.append(f'{METRIC_PREFIX}_command_errors_total'
+                         f'{{command="{command_type}",error="{error}"}} '
+                         f'{count}')
+        name = f'{METRIC_PREFIX}_command_latency_seconds'
+        lines += [f'# HELP {name} Command latency.',
+                  f'# TYPE {name} histogram']
+        for command_type in sorted(counts):
+            histogram = list(self.histograms[command_type])
+            seen = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                seen += count
+                lines.append(f'{name}_bucket{{command="{command_type}",'
+                             f'le="{bound:g}"}} {seen}')
+            seen += histogram[-1]
+            lines.append(f'{name}_bucket{{command="{command_type}",'
+                         f'le="+Inf"}} {seen}')
+            lines.append(f'{name}_sum{{command="{command_type}"}} '
+                         f'{self.latency_sums[command_type]:.9f}')
+            lines.append(f'{name}_count{{command="{command_type}"}} {seen}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        '''write the Prometheus text atomically to path'''
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+class StatsWriter(threading.Thread):
+    '''daemon thread writing stats to a file every interval seconds'''
+    def __init__(self, stats, path, interval=10.0):
+        super().__init__(daemon=True)
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.stats.write_prometheus(self.path)
+
+    def stop(self):
+        '''stop the thread and write a last time'''
+        self._stopped.set()
+        self.stats.write_prometheus(self.path)
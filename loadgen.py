@@ -0,0 +1,208 @@
+'''load generator module
+
+Runs simulated users across a process pool. Every user drives its own
+AppCLI/AppEngine over a realistic command mix; workers report their
+latencies back and the parent prints sessions/sec, commands/sec and
+latency percentiles for each worker count, to show how throughput
+scales with cores.
+
+    python -m shoppinglistapp.loadgen --workers 1,2,4 --sessions 200
+
+With --shared the parent publishes the pool in shared memory and the
+workers attach to it read-only instead of each building its own copy.
+'''
+import argparse
+import os
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from shoppinglistapp.app_cli import AppCLI
+from shoppinglistapp.core.items import Item, ItemPool
+from shoppinglistapp.core.sharedmemitems import SharedItemPool
+from shoppinglistapp.core.shoppinglist import ShoppingList
+
+# relative frequency of each action in a session
+DEFAULT_MIX = {
+    'list': 10,
+    'ask': 30,
+    'show list': 20,
+    'show items': 5,
+    'add': 10,
+    'del': 10,
+}
+# actions left out when workers share a read-only pool
+WRITE_ACTIONS = ('add', 'del')
+LIST_SIZE = 10
+PER_PAGE = 20
+
+
+def make_pool(pool_size, catalog=None):
+    '''make the pool each worker serves'''
+    if catalog:
+        return ItemPool.load(catalog)
+    rng = random.Random(pool_size)
+    item_pool = ItemPool()
+    item_pool.add_items(Item(f'item{i:07d}', round(rng.uniform(0.01, 999), 2))
+                        for i in range(pool_size))
+    return item_pool
+
+
+def run_session(app, rng, commands, mix, session_id, latencies, sink):
+    '''run one simulated user, appending command latencies
+
+    Replies are rendered into ``sink`` so that lazily rendered messages
+    are part of the measured latency.
+    '''
+    actions, weights = list(mix), list(mix.values())
+    added = []
+    size = min(LIST_SIZE, app.app_engine.items.get_size())
+    app.app_engine.shopping_list.refresh(app.app_engine.items, size)
+    for i in range(commands):
+        if app.app_engine.correct_answer is not None:
+            # answer right about half the time
+            cmd = f'{app.app_engine.correct_answer:.2f}' \
+                if rng.random() < 0.5 else '0.01'
+        else:
+            cmd = rng.choices(actions, weights)[0]
+            if cmd == 'show items':
+                pages = max(1, app.app_engine.items.get_size() // PER_PAGE)
+                cmd += f' --page {rng.randint(1, pages)} ' \
+                    f'--per-page {PER_PAGE}'
+            elif cmd == 'add':
+                name = f's{session_id}-{i}'
+                added.append(name)
+                cmd = f'add {name}: {rng.uniform(0.01, 99):.2f}'
+            elif cmd == 'del':
+                cmd = f'del {added.pop()}' if added else 'del missing'
+        start = time.perf_counter()
+        app.execute_command(cmd)
+        app.write_message(sink)
+        latencies.append(time.perf_counter() - start)
+        app.app_engine.message = None
+    for name in added:
+        app.execute_command(f'del {name}')
+
+
+def run_worker(worker_id, sessions, commands, pool_size, catalog, mix, seed,
+               shared=None):
+    '''run sessions in one process, return (elapsed, latencies)
+
+    ``shared`` is the name of a SharedItemPool to attach to instead of
+    making a pool.
+    '''
+    if shared:
+        item_pool = SharedItemPool.attach(shared)
+    else:
+        item_pool = make_pool(pool_size, catalog)
+        # add and del look up similar names, keep the build out of the timings
+        item_pool.build_name_index()
+    rng = random.Random(f'{seed}-{worker_id}')
+    latencies = array('d')
+    with open(os.devnull, 'w', encoding='utf-8') as sink:
+        start = time.perf_counter()
+        for session in range(sessions):
+            app = AppCLI(ShoppingList(), item_pool)
+            run_session(app, rng, commands, mix,
+                        f'{worker_id}.{session}', latencies, sink)
+        elapsed = time.perf_counter() - start
+    if shared:
+        item_pool.close()
+    return elapsed, latencies
+
+
+def get_percentile(values, fraction):
+    '''percentile of sorted values'''
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_load(workers, sessions, commands, pool_size=1000, catalog=None,
+             mix=None, seed=0, shared=False):
+    '''run the load on a number of worker processes, return a report dict
+
+    With ``shared`` the workers read one SharedItemPool, so the write
+    actions are dropped from the mix.
+    '''
+    mix = mix or DEFAULT_MIX
+    writer = None
+    if shared:
+        mix = {action: weight for action, weight in mix.items()
+               if action not in WRITE_ACTIONS}
+        writer = SharedItemPool.create(f'shoppinglist-loadgen-{os.getpid()}',
+                                       make_pool(pool_size, catalog))
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_worker, worker_id, sessions,
+                                       commands, pool_size, catalog, mix,
+                                       seed, writer and writer.name)
+                       for worker_id in range(workers)]
+            results = [future.result() for future in futures]
+    finally:
+        if writer is not None:
+            writer.close()
+    wall = time.perf_counter() - start
+    latencies = sorted(latency for _, worker_latencies in results
+                       for latency in worker_latencies)
+    # rates use the slowest worker's session time, without pool setup
+    busy = max(elapsed for elapsed, _ in results)
+    return {
+        'workers': workers,
+        'sessions': workers * sessions,
+        'commands': len(latencies),
+        'wall_sec': wall,
+        'sessions_per_sec': workers * sessions / busy,
+        'commands_per_sec': len(latencies) / busy,
+        'p50_ms': get_percentile(latencies, 0.50) * 1000,
+        'p90_ms': get_percentile(latencies, 0.90) * 1000,
+        'p99_ms': get_percentile(latencies, 0.99) * 1000,
+    }
+
+
+def parse_args(argv=None):
+    '''parse command line arguments'''
+    parser = argparse.ArgumentParser(description='Session load generator.')
+    parser.add_argument('--workers', default=None,
+                        help='comma separated worker counts to compare '
+                        '(default: 1, 2, 4, ... up to the number of cores)')
+    parser.add_argument('--sessions', type=int, default=100,
+                        help='sessions per worker')
+    parser.add_argument('--commands', type=int, default=50,
+                        help='commands per session')
+    parser.add_argument('--pool-size', type=int, default=1000)
+    parser.add_argument('--catalog', metavar='FILE',
+                        help='load the item pool from a .csv or .jsonl file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shared', action='store_true',
+                        help='serve one read-only pool from shared memory '
+                        '(add/del are left out of the mix)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    '''command line entry point'''
+    args = parse_args(argv)
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        cores = os.cpu_count() or 1
+        worker_counts = [1 << i for i in range(cores.bit_length())
+                         if 1 << i <= cores]
+    print(f'{"WORKERS":>7} {"SESS/S":>10} {"CMD/S":>10} {"SPEEDUP":>8} '
+          f'{"P50(ms)":>8} {"P90(ms)":>8} {"P99(ms)":>8}')
+    base = None
+    for workers in worker_counts:
+        report = run_load(workers, args.sessions, args.commands,
+                          args.pool_size, args.catalog, seed=args.seed,
+                          shared=args.shared)
+        base = base or report['commands_per_sec']
+        print(f'{workers:>7} {report["sessions_per_sec"]:>10.1f} '
+              f'{report["commands_per_sec"]:>10.0f} '
+              f'{report["commands_per_sec"] / base:>8.2f} '
+              f'{report["p50_ms"]:>8.3f} {report["p90_ms"]:>8.3f} '
+              f'{report["p99_ms"]:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,28 @@
+import asyncio
+import io
 import math
+import os
+import sqlite3
+import threading
 import pytest
 from shoppinglistapp.core.items import Item, ItemPool
+from shoppinglistapp.core.knapsack import solve_budget
+from shoppinglistapp.core.nameindex import NameIndex
 from shoppinglistapp.core.appengine import AppEngine
+from shoppinglistapp.core.commands import route
+from shoppinglistapp.core.concurrentitems import ConcurrentItemPool
+from shoppinglistapp.core.journal import JournaledItemPool, SYNC_MODES
 from shoppinglistapp.core.shoppinglist import ShoppingList
-from shoppinglistapp.core.errors import InvalidItemNameError, InvalidItemPriceError, InvalidItemPoolError, DuplicateItemError, NonExistingItemError, InvalidShoppingListSizeError
-from shoppinglistapp.app_cli import AppCLI
+from shoppinglistapp.core.sharedmemitems import SharedItemPool
+from shoppinglistapp.core.snapshot import SnapshotItemPool, write_snapshot
+from shoppinglistapp.core import sortedlist
+from shoppinglistapp.core.sortedlist import SortedList
+from shoppinglistapp.core.sqliteitems import SCHEMA, SqliteItemPool
+from shoppinglistapp.core.stats import CommandStats
+from shoppinglistapp.core.errors import InvalidItemNameError, InvalidItemPriceError, InvalidItemPoolError, DuplicateItemError, NonExistingItemError, InvalidShoppingListSizeError, InvalidCatalogFormatError, ReadOnlyItemPoolError, ChangedItemPoolError
+from shoppinglistapp import benchmarks, loadgen
+from shoppinglistapp.app_cli import AppCLI, EMPTY_LIST_MESSAGE
+from shoppinglistapp.app_server import AppServer, ServerSession, READ_ONLY_MESSAGE
 
 '''test items.py'''
 # test item class
@@ -20,6 +38,12 @@ def test_invalid_item_init():
         Item(True, .99)
     with pytest.raises(InvalidItemPriceError):
         Item('bread', -3.25)
+    with pytest.raises(InvalidItemPriceError):
+        Item('bread', float('inf'))
+    item = Item('bread', 3.25)
+    with pytest.raises(InvalidItemPriceError):
+        item.price = float('inf')
+    assert item.get_order() == 0
 
 def test_item_get_order():
     item = Item('bread', 3.25)
@@ -52,6 +76,18 @@ def test_item_eq():
     assert item1 == item2
     assert item1 != item3
 
+def test_item_slots_and_hash():
+    item = Item('bread', 3.25)
+    with pytest.raises(AttributeError):
+        item.color = 'brown'
+    assert Item(''.join(['bre', 'ad']), 1.00).name is item.name
+    assert hash(item) == hash(Item('bread', 3.25))
+    assert len({item, Item('bread', 3.25), Item('bread', 3.50)}) == 2
+    item.price = 0.05
+    assert item.get_order() == -2
+    with pytest.raises(InvalidItemPriceError):
+        item.price = 0
+
 #test ItemPool class
 def test_valid_item_pool_init():
     item_pool = ItemPool()
@@ -106,6 +142,378 @@ def test_item_pool_eq():
     assert ip_1 == ip_2
     assert ip_1 != ip_3
 
+def test_item_pool_slots_after_remove():
+    item_pool = ItemPool()
+    for name, price in [('bread', 0.99), ('milk', 1.25), ('eggs', 2.5)]:
+        item_pool.add_item(Item(name, price))
+    item_pool.remove_item('bread')
+    assert item_pool.get_size() == 2
+    assert sorted(item_pool._names) == ['eggs', 'milk']
+    for name, slot in item_pool._index.items():
+        assert item_pool._names[slot] == name
+        assert item_pool._prices[slot] == item_pool.items[name].price
+    assert sorted(item.name for item in item_pool.sample_items(5)) == \
+        ['eggs', 'milk']
+
+def test_item_pool_add_items():
+    item_pool = ItemPool({'bread': Item('bread', 0.99)})
+    rejected = item_pool.add_items([Item('milk', 1.25), Item('bread', 2.00),
+                                    'eggs', Item('milk', 1.30)])
+    assert item_pool.get_size() == 2
+    assert item_pool.items['milk'].price == 1.25
+    assert [type(err) for _, err in rejected] == \
+        [DuplicateItemError, InvalidItemPoolError, DuplicateItemError]
+
+def test_item_pool_load_dump(tmp_path):
+    csv_path = tmp_path / 'catalog.csv'
+    csv_path.write_text('name,price\nbread,0.99\nmilk,hi\n,1.00\n'
+                        'eggs,2.50\nbread,1.99\nbad,inf\n')
+    rejected = []
+    item_pool = ItemPool.load(csv_path, chunk_size=2, rejected=rejected)
+    assert item_pool == ItemPool({'bread': Item('bread', 0.99),
+                                  'eggs': Item('eggs', 2.50)})
+    assert sorted(line_no for line_no, _ in rejected) == [3, 4, 6, 7]
+    # the sorted indexes are built once the chunks are in
+    assert item_pool.get_sorted_names() == ['bread', 'eggs']
+    assert item_pool.get_items_by_price(1.00) == [Item('eggs', 2.50)]
+    bad_path = tmp_path / 'bad.jsonl'
+    bad_path.write_text('{"name": "x", "price": 1e999}\n'
+                        '{"name": "y", "price": null}\n'
+                        '{"name": "z", "price": 1.5}\n')
+    rejected = []
+    assert ItemPool.load(bad_path, rejected=rejected).get_size() == 1
+    assert [line_no for line_no, _ in rejected] == [1, 2]
+    jsonl_path = tmp_path / 'catalog.jsonl'
+    assert item_pool.dump(jsonl_path) == 2
+    assert ItemPool.load(jsonl_path) == item_pool
+    with pytest.raises(InvalidCatalogFormatError):
+        item_pool.dump(tmp_path / 'catalog.txt')
+
+def test_item_pool_sorted_indexes():
+    item_pool = ItemPool({'milk': Item('milk', 1.25)})
+    item_pool.add_item(Item('bread', 0.99))
+    item_pool.add_items([Item('eggs', 2.50), Item('apple', 1.25)])
+    item_pool.add_item(Item('tea', 5.00))
+    item_pool.remove_item('eggs')
+    assert item_pool.get_sorted_names() == ['apple', 'bread', 'milk', 'tea']
+    assert item_pool.get_sorted_names(1, 3) == ['bread', 'milk']
+    assert [item.name for item in item_pool.get_items_by_price(1.25, 5)] == \
+        ['apple', 'milk', 'tea']
+    assert [item.name for item in item_pool.get_items_by_price(high=1.25)] == \
+        ['bread', 'apple', 'milk']
+    assert item_pool.get_items_by_price(1.26, 4.99) == []
+
+def test_sorted_list(monkeypatch):
+    monkeypatch.setattr(sortedlist, 'BLOCK_SIZE', 2)
+    values = SortedList([5, 1, 9])
+    for value in [7, 3, 8, 2, 6]:
+        values.add(value)
+    values.update([4, 0])
+    values.remove(9)
+    values.remove(0)
+    assert list(values) == values[:] == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert len(values) == 8 and values[3] == 4 and values[-1] == 8
+    assert values[2:5] == list(values.islice(2, 5)) == [3, 4, 5]
+    assert values.bisect_left(4) == 3 and values.bisect_right(4) == 4
+    assert values.bisect_left(10) == 8
+    copy = values.copy()
+    copy.remove(5)
+    assert 5 in list(values)
+
+def test_sqlite_item_pool(tmp_path):
+    path = tmp_path / 'items.db'
+    with SqliteItemPool(path) as item_pool:
+        item_pool.add_item(Item('bread', 0.99))
+        assert item_pool.add_items([Item('milk', 1.25), Item('eggs', 2.50),
+                                    Item('bread', 1.00)])[0][0].name == 'bread'
+        with pytest.raises(DuplicateItemError):
+            item_pool.add_item(Item('milk', 1.25))
+        item_pool.remove_item('bread')
+        with pytest.raises(NonExistingItemError):
+            item_pool.remove_item('bread')
+    item_pool = SqliteItemPool(path)
+    assert item_pool.get_size() == 2
+    assert 'milk' in item_pool.items and 'bread' not in item_pool.items
+    assert item_pool.items['eggs'] == Item('eggs', 2.50)
+    assert sorted(item.name for item in item_pool.sample_items(5)) == \
+        ['eggs', 'milk']
+    assert item_pool.get_sorted_names(1) == ['milk']
+    assert item_pool.get_items_by_price(high=2) == [Item('milk', 1.25)]
+    app = AppCLI(ShoppingList(), item_pool)
+    app.execute_command('add tea: 3.10')
+    app.execute_command('del milk')
+    app.execute_command('list')
+    assert app.show_items() == 'ITEMS\n- eggs ... $2.50\n- tea .... $3.10\n'
+    # the name index follows rows moved into freed slots
+    assert item_pool.suggest_names('egs') == ['eggs']
+    assert item_pool.find_names('milk') == []
+    # and is built for databases made without it
+    old_path = tmp_path / 'old.db'
+    conn = sqlite3.connect(old_path)
+    with conn:
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT INTO items VALUES (0, 'butter', 1.5)")
+    conn.close()
+    assert SqliteItemPool(old_path).suggest_names('buter') == ['butter']
+    item_pool.close()
+
+def test_item_pool_weighted_sampling():
+    item_pool = ItemPool()
+    for i in range(10):
+        item_pool.add_item(Item(f'item{i}', 1.00 + i))
+    assert item_pool.get_weight('item3') == 1.0
+    for i in range(10):
+        item_pool.set_weight(f'item{i}', 0 if i % 2 else 1)
+    item_pool.add_item(Item('item10', 11.00))
+    item_pool.set_weight('item10', 0)
+    item_pool.remove_item('item0')
+    assert item_pool.get_weight('item9') == 0
+    assert sorted(item.name for item in item_pool.sample_items(
+        10, weighted=True)) == ['item2', 'item4', 'item6', 'item8']
+    assert item_pool.count_items(3, 6) == 4
+    assert sorted(item.name for item in item_pool.sample_items(
+        10, min_price=3, max_price=6)) == ['item2', 'item3', 'item4', 'item5']
+    assert sorted(item.name for item in item_pool.sample_items(
+        10, weighted=True, min_price=3, max_price=6)) == ['item2', 'item4']
+    with pytest.raises(NonExistingItemError):
+        item_pool.set_weight('item0', 1)
+    with pytest.raises(ValueError):
+        item_pool.set_weight('item1', -1)
+
+def test_snapshot_item_pool(tmp_path):
+    path = tmp_path / 'items.snap'
+    ip = ItemPool()
+    for name, price in [('milk', 1.25), ('bread', 0.99), ('eggs', 2.50),
+                        ('tea', 1.25)]:
+        ip.add_item(Item(name, price))
+    assert write_snapshot(ip, path) == 4
+    item_pool = SnapshotItemPool(path)
+    assert item_pool.get_size() == 4
+    assert item_pool.items['milk'] == Item('milk', 1.25)
+    assert 'coffee' not in item_pool.items
+    assert item_pool.get_sorted_names(1, 3) == ['eggs', 'milk']
+    assert [item.name for item in item_pool.get_items_by_price(1, 2)] == \
+        ['milk', 'tea']
+    item_pool.add_item(Item('coffee', 1.50))
+    item_pool.remove_item('milk')
+    with pytest.raises(DuplicateItemError):
+        item_pool.add_item(Item('eggs', 1.00))
+    with pytest.raises(NonExistingItemError):
+        item_pool.remove_item('milk')
+    assert item_pool.get_size() == 4
+    assert item_pool.get_sorted_names() == ['bread', 'coffee', 'eggs', 'tea']
+    assert [item.name for item in item_pool.get_items_by_price(1, 2)] == \
+        ['tea', 'coffee']
+    assert sorted(item.name for item in item_pool.sample_items(10)) == \
+        ['bread', 'coffee', 'eggs', 'tea']
+    app = AppCLI(ShoppingList(), item_pool)
+    app.execute_command('del coffee')
+    app.execute_command('add juice: 3.00')
+    assert app.show_items() == 'ITEMS\n- bread ... $0.99\n- eggs .... $2.50\n' \
+        '- juice ... $3.00\n- tea ..... $1.25\n'
+    write_snapshot(item_pool, path)
+    item_pool.close()
+    assert ItemPool({item.name: item for item in
+                     SnapshotItemPool(path).items.values()}) == ItemPool(
+        {'bread': Item('bread', 0.99), 'eggs': Item('eggs', 2.50),
+         'juice': Item('juice', 3.00), 'tea': Item('tea', 1.25)})
+    path.write_bytes(b'nope')
+    with pytest.raises(InvalidCatalogFormatError):
+        SnapshotItemPool(path)
+
+def test_concurrent_item_pool():
+    item_pool = ConcurrentItemPool({'milk': Item('milk', 1.25)})
+    before = item_pool.snapshot()
+    item_pool.add_item(Item('bread', 0.99))
+    with pytest.raises(DuplicateItemError):
+        with item_pool.edit() as draft:
+            draft.add_item(Item('eggs', 2.50))
+            draft.add_item(Item('milk', 1.00))
+    assert before.get_sorted_names() == ['milk']
+    assert item_pool.get_sorted_names() == ['bread', 'milk']
+    assert item_pool.version == 1
+    errors = []
+
+    def read():
+        try:
+            for _ in range(200):
+                snapshot = item_pool.snapshot()
+                for name in snapshot.get_sorted_names():
+                    assert name in snapshot.items
+                snapshot.sample_items(3)
+        except Exception as err:
+            errors.append(err)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(100):
+        item_pool.add_item(Item(f'item{i}', 1.00))
+        item_pool.remove_item(f'item{i}')
+    for reader in readers:
+        reader.join()
+    assert not errors
+    app = AppCLI(ShoppingList(), item_pool)
+    app.execute_command('add tea: 1.10')
+    assert app.show_items() == 'ITEMS\n- bread ... $0.99\n- milk .... $1.25\n' \
+        '- tea ..... $1.10\n'
+
+def test_item_pool_apply_batch():
+    for item_pool in (ItemPool({'milk': Item('milk', 1.25)}),
+                      SqliteItemPool(), ConcurrentItemPool(
+                          {'milk': Item('milk', 1.25)})):
+        item_pool.add_items([Item('milk', 1.25)])
+        results = item_pool.apply_batch([('add', Item('tea', 1.00)),
+                                         ('del', 'milk'), ('del', 'milk')])
+        assert [type(error) for _, error in results] == \
+            [type(None), type(None), NonExistingItemError]
+        assert sorted(item_pool.items) == ['milk']
+        item_pool.apply_batch([('del', 'milk'), ('add', Item('milk', 2.00)),
+                               ('add', Item('tea', 1.00))])
+        assert item_pool.items['milk'].price == 2.00
+        assert item_pool.get_size() == 2
+
+def test_item_pool_find_names(tmp_path):
+    items = {name: Item(name, 1.00) for name in
+             ['milk', 'milkshake', 'mild salsa', 'bread', 'butter']}
+    write_snapshot(ItemPool(dict(items)), tmp_path / 'items.slps')
+    sqlite_pool = SqliteItemPool()
+    sqlite_pool.add_items(items.values())
+    for item_pool in (ItemPool(dict(items)), ConcurrentItemPool(dict(items)),
+                      sqlite_pool, SnapshotItemPool(tmp_path / 'items.slps')):
+        item_pool.build_name_index()
+        assert item_pool.find_names('milk')[:2] == ['milk', 'milkshake']
+        assert item_pool.find_names('buter') == ['butter']
+        assert item_pool.suggest_names('mlik') == ['milk']
+        assert item_pool.suggest_names('zzz') == []
+        # the index follows later changes
+        item_pool.remove_item('butter')
+        item_pool.add_item(Item('buttermilk', 2.00))
+        assert item_pool.find_names('butt') == ['buttermilk']
+        assert 'butter' not in item_pool.find_names('buter')
+
+def test_name_index_background_build():
+    started, release = threading.Event(), threading.Event()
+
+    def names():
+        started.set()
+        release.wait()
+        yield from ['milk', 'bread']
+
+    index = NameIndex()
+    index.add('tea')  # not started, left to the build
+    index.start(names())
+    started.wait()
+    # changes during the build are queued, and lookups do not wait
+    index.add('butter')
+    index.remove('bread')
+    other = index.copy()
+    other.add('mlik')
+    assert index.search('milk') == [] and not index.ready
+    release.set()
+    index.wait()
+    assert index.search('buter') == ['butter']
+    assert index.search('bread') == []
+    assert other.search('milk') == ['milk', 'mlik']
+    assert index.search('milk') == ['milk']
+
+def test_shared_item_pool():
+    name = f'shoppinglist-test-{os.getpid()}'
+    with SharedItemPool.create(name, ItemPool({
+            'milk': Item('milk', 1.25), 'bread': Item('bread', 0.99)})) \
+            as writer, SharedItemPool.attach(name) as reader:
+        assert reader.version == 1
+        assert sorted(reader.items) == ['bread', 'milk']
+        assert reader.items['milk'] == Item('milk', 1.25)
+        assert len(reader.sample_items(5)) == 2
+        writer.add_items([Item('tea', 3.50), Item('milk', 1.25)])
+        with pytest.raises(NonExistingItemError):
+            writer.remove_item('cheese')
+        # only changes publish a new generation
+        assert writer.version == 2
+        assert reader.version == 2
+        assert reader.get_sorted_names() == ['bread', 'milk', 'tea']
+        assert reader.get_items_by_price(1.00, 5.00) == \
+            [Item('milk', 1.25), Item('tea', 3.50)]
+        with pytest.raises(ReadOnlyItemPoolError):
+            reader.add_item(Item('cheese', 7.99))
+        app = AppCLI(ShoppingList(), reader)
+        app.execute_command('show items')
+        writer.remove_item('tea')
+        app.execute_command('show items')
+        assert app.app_engine.message == \
+            'ITEMS\n- bread ... $0.99\n- milk .... $1.25\n'
+    with pytest.raises(FileNotFoundError):
+        SharedItemPool.attach(name)
+
+def test_shared_item_pool_stream(capsys):
+    name = f'shoppinglist-stream-{os.getpid()}'
+    with SharedItemPool.create(name, ItemPool({
+            f'item{i:04}': Item(f'item{i:04}', 1.00) for i in range(3000)})) \
+            as writer, SharedItemPool.attach(name) as reader:
+        lines = AppCLI(ShoppingList(), reader).get_items_render()
+        assert next(lines) == 'ITEMS\n'
+        # the streamed generation stays mapped while the reader moves on
+        for i in range(2):
+            writer.add_item(Item(f'new{i}', 2.00))
+            assert reader.version == i + 2
+        assert len(list(lines)) == 3000
+        del lines
+        assert sum(release.alive for release in reader._releases) == 1
+
+def test_journaled_item_pool(tmp_path):
+    for sync in SYNC_MODES:
+        directory = tmp_path / sync
+        with JournaledItemPool(directory, ItemPool(
+                {'milk': Item('milk', 1.25)}), sync=sync) as item_pool:
+            item_pool.add_item(Item(f'tea-{sync}', 3.50))
+            item_pool.remove_item('milk')
+            item_pool.add_item(Item('milk', 1.30))
+            with pytest.raises(DuplicateItemError):
+                item_pool.add_item(Item('milk', 9.99))
+            item_pool.add_items([Item(f'jam-{sync}', 2.00), Item('milk', 1)])
+            item_pool.apply_batch([('del', f'jam-{sync}'), ('del', 'milk')])
+            item_pool.apply_batch([('add', Item('milk', 1.25)),
+                                   ('del', 'cheese')])
+        # the seed pool is only used for a new directory
+        item_pool = JournaledItemPool(directory, ItemPool())
+        assert sorted(item_pool.items) == [f'tea-{sync}']
+        item_pool.close()
+    # a torn last line is dropped on replay
+    with open(directory / 'journal.jsonl', 'ab') as file:
+        file.write(b'[["add","bread",0.9')
+    with JournaledItemPool(directory, compact_every=3) as item_pool:
+        assert 'bread' not in item_pool.items
+        # five change sets were replayed, so this one compacts
+        item_pool.add_item(Item('bread', 0.99))
+        assert (directory / 'journal.jsonl').read_bytes() == b''
+        item_pool.add_item(Item('butter', 2.49))
+        item_pool.add_item(Item('cheese', 7.99))
+    with JournaledItemPool(directory) as item_pool:
+        assert item_pool.get_size() == 4
+        assert item_pool.items['cheese'] == Item('cheese', 7.99)
+
+def test_journal_group_commit(tmp_path):
+    item_pool = JournaledItemPool(tmp_path, sync='group', window=0.001)
+
+    def writer(slot):
+        for i in range(50):
+            item_pool.add_item(Item(f'item{slot}-{i}', 1.00))
+
+    threads = [threading.Thread(target=writer, args=(slot,))
+               for slot in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    item_pool.close()
+    assert JournaledItemPool(tmp_path).get_size() == 200
+    results = benchmarks.run_durability([1, 2], duration=0.05,
+                                        out=io.StringIO())
+    assert sorted(results) == sorted(SYNC_MODES)
+    assert all(rate > 0 for rates in results.values()
+               for rate in rates.values())
+
 
 '''test shoppinglist.py'''
 def test_shoppinglist_init():
@@ -157,6 +565,182 @@ def test_shoppinglist_len():
     sp = ShoppingList(size=2, quantities=[1, 1], item_pool=ip)
     assert sp.__len__ != len(sp.list)
 
+def test_shoppinglist_running_stats():
+    ip = ItemPool({'Milk': Item('Milk', 4.25), 'Macbook': Item('Macbook', 1999.99)})
+    sp = ShoppingList(size=2, quantities=[1, 1], item_pool=ip)
+    assert sp.get_total_cents() == 200424
+    assert sp.get_max_name_len() == 7
+    assert sp.get_max_order() == 3
+    sp.remove_item([item.name for item, _ in sp.list].index('Macbook'))
+    assert sp.get_total_price() == 4.25
+    assert sp.get_max_name_len() == 4
+    assert sp.get_max_order() == 0
+    sp.add_item(Item('Hotel Room', 255.00), 3)
+    assert sp.get_total_price() == 769.25
+    assert sp.get_max_name_len() == 10
+    assert sp.get_max_order() == 2
+    with pytest.raises(ValueError):
+        sp.add_item(Item('Milk', 4.25), 0)
+
+def test_shoppinglist_refresh_stats_match_add_item():
+    ip = ItemPool({'Gum': Item('Gum', 0.25), 'Mint': Item('Mint', 0.5)})
+    refreshed = ShoppingList(size=2, quantities=[1, 1], item_pool=ip)
+    added = ShoppingList()
+    for item, qnt in refreshed.list:
+        added.add_item(item, qnt)
+    assert refreshed.get_max_order() == added.get_max_order() == -1
+    assert refreshed.get_max_name_len() == added.get_max_name_len() == 4
+    assert refreshed.get_total_cents() == added.get_total_cents() == 75
+
+def test_price_lists():
+    pytest.importorskip('numpy')
+    from shoppinglistapp.core import pricing
+    ip = ItemPool()
+    for i in range(50):
+        ip.add_item(Item(f'item{i}', 0.01 + i * 13.37))
+    lists = [ShoppingList(size=(i % 7) + 1, item_pool=ip) for i in range(40)]
+    lists.append(ShoppingList())
+    line_prices, totals = pricing.price_lists(lists)
+    for i, sp in enumerate(lists):
+        assert totals[i] == sp.get_total_price()
+        for j in range(len(sp)):
+            assert line_prices[i, j] == sp.get_item_price(j)
+    # a list keeps the price an item had when it was drawn
+    old = ShoppingList(size=1, quantities=[1], item_pool=ItemPool(
+        {'tea': Item('tea', 1.10)}))
+    ip.add_item(Item('tea', 5.00))
+    new = ShoppingList(size=1, quantities=[2], item_pool=ItemPool(
+        {'tea': ip.items['tea']}))
+    line_prices, totals = pricing.price_lists([old, new])
+    assert list(totals) == [old.get_total_price(), new.get_total_price()] \
+        == [1.10, 10.00]
+    # lists over other pool backends
+    sqlite_pool = SqliteItemPool()
+    sqlite_pool.add_items(ip.items.values())
+    lists = [ShoppingList(size=3, item_pool=sqlite_pool) for _ in range(5)]
+    _, totals = pricing.price_lists(lists)
+    assert list(totals) == [sp.get_total_price() for sp in lists]
+
+def test_shoppinglist_generate_many():
+    ip = ItemPool()
+    for i in range(20):
+        ip.add_item(Item(f'item{i}', 1.00 + i))
+    batch = ShoppingList.generate_many(ip, 50, size_range=(2, 5), seed=7)
+    assert len(batch) == 50
+    again = ShoppingList.generate_many(ip, 10, size_range=(2, 5), seed=7)
+    for i, sp in enumerate(again):
+        assert sp.list == batch[i].list
+        assert 2 <= len(sp) <= 5
+        assert len({item.name for item, _ in sp.list}) == len(sp)
+        assert all(1 <= qnt <= 9 for _, qnt in sp.list)
+    assert batch[-1].list == batch[49].list
+    with pytest.raises(InvalidShoppingListSizeError):
+        ShoppingList.generate_many(ip, 1, size_range=(1, 21))
+    with pytest.raises(ValueError):
+        ShoppingList.generate_many(ip, 1, size_range=(0, 3))
+    # slots are only valid for the pool version they were drawn from
+    ip.remove_item('item0')
+    with pytest.raises(ChangedItemPoolError):
+        batch[0]
+    pool = ConcurrentItemPool(dict(ip.items))
+    batch = ShoppingList.generate_many(pool, 5, size_range=(1, 3), seed=1)
+    pool.add_item(Item('tea', 1.00))
+    assert 1 <= len(batch[4]) <= 3
+    with pytest.raises(InvalidItemPoolError):
+        ShoppingList.generate_many(SqliteItemPool(), 1)
+
+def test_shoppinglist_refresh_constrained():
+    ip = ItemPool()
+    for i in range(10):
+        ip.add_item(Item(f'item{i}', 1.00 + i))
+    sp = ShoppingList()
+    sp.refresh(ip, size=3, min_price=5, max_price=7,
+               quantity_weights=[0] * 8 + [1])
+    assert sorted(item.name for item, _ in sp.list) == \
+        ['item4', 'item5', 'item6']
+    assert sp.get_total_price() == 9 * 18
+    with pytest.raises(InvalidShoppingListSizeError):
+        sp.refresh(ip, size=4, min_price=5, max_price=7)
+    ip.set_weight('item9', 0)
+    for _ in range(20):
+        sp.refresh(ip, size=9, weighted=True)
+        assert 'item9' not in [item.name for item, _ in sp.list]
+    with pytest.raises(InvalidShoppingListSizeError):
+        sp.refresh(ip, size=10, weighted=True)
+    for i in range(2, 9):
+        ip.set_weight(f'item{i}', 0)
+    assert ip.count_items(weighted=True) == 2
+    assert ip.count_items(1, 3, weighted=True) == 2
+    with pytest.raises(InvalidShoppingListSizeError):
+        sp.refresh(ip, size=4, weighted=True)
+    for _ in range(20):
+        sp.refresh(ip, weighted=True)
+        assert 1 <= len(sp) <= 2
+
+def test_solve_budget():
+    cents = [499, 125, 1000, 250, 799]
+    total, picks = solve_budget(cents, 2, 1500)
+    assert total == 1500
+    assert len({i for i, _ in picks}) == 2
+    assert sum(cents[i] * qnt for i, qnt in picks) == 1500
+    assert all(1 <= qnt <= 9 for _, qnt in picks)
+    # no exact total: best under the budget
+    assert solve_budget([300, 700], 2, 1099) == (1000, [(0, 1), (1, 1)])
+    assert solve_budget([300, 700], 2, 999) is None
+    assert solve_budget([300, 700], 3, 10000) is None
+
+def test_shoppinglist_refresh_budget():
+    ip = ItemPool({name: Item(name, price) for name, price in
+                   [('milk', 1.25), ('bread', 0.99), ('tea', 3.50),
+                    ('cheese', 7.99), ('steak', 25.18)]})
+    sp = ShoppingList()
+    sp.refresh(ip, size=3, budget=20.00)
+    assert len(sp) == 3
+    # the best total (2000 cannot be reached with three of these)
+    assert sp.get_total_cents() == 1999
+    assert len({item.name for item, _ in sp.list}) == 3
+    sp.refresh(ip, budget=10.00)
+    assert 1 <= len(sp) <= 5 and sp.get_total_cents() <= 1000
+    with pytest.raises(InvalidShoppingListSizeError):
+        sp.refresh(ip, size=4, budget=3.00)
+    with pytest.raises(ValueError):
+        sp.refresh(ip, size=2, quantities=[1, 1], budget=5.00)
+    with pytest.raises(ValueError):
+        sp.refresh(ip, size=2, budget=-1)
+    # no item fits under the budget
+    with pytest.raises(InvalidShoppingListSizeError):
+        sp.refresh(ip, budget=0.50)
+
+def test_shoppinglist_refresh_budget_pools(tmp_path):
+    items = {name: Item(name, price) for name, price in
+             [('milk', 1.25), ('bread', 0.99), ('tea', 3.50),
+              ('cheese', 7.99), ('steak', 25.18)]}
+    write_snapshot(ItemPool(dict(items)), tmp_path / 'items.slps')
+    snapshot_pool = SnapshotItemPool(tmp_path / 'items.slps')
+    snapshot_pool.remove_item('tea')
+    snapshot_pool.add_item(Item('jam', 2.50))
+    sqlite_pool = SqliteItemPool()
+    sqlite_pool.add_items(items.values())
+    shared_pool = SharedItemPool.create(
+        f'shoppinglist-budget-{os.getpid()}', ItemPool(dict(items)))
+    sp = ShoppingList()
+    for item_pool in (snapshot_pool, sqlite_pool, shared_pool):
+        assert item_pool.count_items(1.00, 8.00) == 3
+        sp.refresh(item_pool, size=2, min_price=1.00, max_price=8.00)
+        assert all(1.00 <= item.price <= 8.00 for item, _ in sp.list)
+        sp.refresh(item_pool, size=3, budget=12.00)
+        assert len(sp) == 3 and sp.get_total_cents() <= 1200
+        with pytest.raises(InvalidShoppingListSizeError):
+            sp.refresh(item_pool, budget=0.50)
+        # every item has weight 1 on these pools
+        sp.refresh(item_pool, size=3, weighted=True)
+        assert len(sp) == 3
+        sp.refresh(item_pool, size=2, weighted=True, budget=12.00)
+        assert sp.get_total_cents() <= 1200
+        with pytest.raises(InvalidShoppingListSizeError):
+            sp.refresh(item_pool, size=5, weighted=True, max_price=8.00)
+    shared_pool.close()
+
 
 '''test appengine.py'''
 def test_appengine_init():
@@ -221,4 +805,254 @@ def test_process_del_item():
     app.app_engine.process_del_item('del banana')
     assert app.app_engine.message == 'Item named "banana" is not present in the item pool.'
     app.app_engine.process_del_item('del Macbook')
-    assert app.app_engine.message == "Macbook removed successfully."
\ No newline at end of file
+    assert app.app_engine.message == "Macbook removed successfully."
+
+def test_name_suggestions():
+    ip = ItemPool({'Macbook': Item('Macbook', 1999.99)})
+    app = AppCLI(ShoppingList(), ip)
+    ip.build_name_index()
+    app.execute_command('del Macbok')
+    assert app.app_engine.message == 'Item named "Macbok" is not ' \
+        'present in the item pool.\nDid you mean: Macbook?'
+    app.execute_command('add Macbook: 5')
+    assert app.app_engine.message == 'Duplicate!'
+    app.execute_command('add macbook: 5')
+    assert app.app_engine.message == 'Item(macbook, 5.0) added ' \
+        'successfully.\nSimilar items already in the pool: Macbook.'
+    app.execute_command('find Mac')
+    assert app.app_engine.message == 'ITEMS\n- Macbook ... $1999.99\n' \
+        '- macbook ... $0005.00\n'
+    app.execute_command('find tea')
+    assert app.app_engine.message == 'No items match "tea".'
+    app.execute_command('find ')
+    assert app.app_engine.message == 'Usage: find <text>'
+
+def test_show_items_pages():
+    ip = ItemPool()
+    for name, price in [('Milk', 4.25), ('Macbook', 1999.99), ('Beef', 25.18)]:
+        ip.add_item(Item(name, price))
+    app = AppCLI(ShoppingList(), ip)
+    assert app.show_items() == 'ITEMS\n- Beef ...... $0025.18\n' \
+        '- Macbook ... $1999.99\n- Milk ...... $0004.25\n'
+    assert app.show_items(page=2, per_page=2) == 'ITEMS\n- Milk ... $4.25\n'
+    app.execute_command('show items --page 1 --per-page 1')
+    out = io.StringIO()
+    app.write_message(out)
+    assert out.getvalue() == 'ITEMS\n- Beef ... $25.18\n\n'
+    app.execute_command('show items --page x')
+    assert app.app_engine.message.startswith('Usage: show items')
+
+def test_show_items_price_range():
+    ip = ItemPool()
+    for name, price in [('Milk', 4.25), ('Macbook', 1999.99), ('Beef', 25.18)]:
+        ip.add_item(Item(name, price))
+    app = AppCLI(ShoppingList(), ip)
+    app.execute_command('show items from 4 to 30')
+    assert ''.join(app.app_engine.message) == \
+        'ITEMS\n- Milk ... $04.25\n- Beef ... $25.18\n'
+    app.execute_command('show items under 5')
+    assert ''.join(app.app_engine.message) == 'ITEMS\n- Milk ... $4.25\n'
+    app.execute_command('show items over 5')
+    assert app.app_engine.message.startswith('Usage: show items')
+
+def test_server_sessions():
+    ip = ItemPool({'Milk': Item('Milk', 4.25)})
+    server = AppServer(ip)
+
+    async def session(commands):
+        servers = await server.start(port=0)
+        port = servers[0].sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        replies = []
+        for cmd in commands:
+            writer.write(cmd.encode() + b'\n')
+            lines = []
+            while (line := await reader.readline()) not in (b'\n', b''):
+                lines.append(line.decode())
+            replies.append(''.join(lines))
+        writer.close()
+        servers[0].close()
+        return replies
+
+    replies = asyncio.run(session(['show list', 'list', 'add tea: 1', 'q']))
+    assert replies == [EMPTY_LIST_MESSAGE + '\n',
+                       'Shopping list with 1 items has been created.\n',
+                       READ_ONLY_MESSAGE + '\n', 'Have a nice day!\n']
+    assert ip.get_size() == 1
+    writable = ServerSession(ip, read_only=False)
+    assert writable.reply('add tea: 1') == 'Item(tea, 1.0) added successfully.\n\n'
+    assert writable.reply('profile on') == \
+        '"profile on" is not a valid command.\n\n'
+    # a failing command gets an error reply, the session goes on
+    empty = ServerSession(ItemPool())
+    assert empty.reply('list').startswith('"list" failed: ValueError')
+    assert empty.reply('show list') == EMPTY_LIST_MESSAGE + '\n\n'
+    assert writable.profiler is None
+
+def test_server_http_sessions():
+    server = AppServer(ItemPool({'Milk': Item('Milk', 4.25)}))
+    session_id, session = server.get_http_session()
+    other_id, other = server.get_http_session()
+    assert len(session_id) == 32 and other_id != session_id
+    assert server.get_http_session(session_id) == (session_id, session)
+    # clients cannot pick their session id
+    assert server.get_http_session('mine')[0] not in ('mine', session_id)
+    # idle sessions are dropped
+    server.http_timeout = 0
+    new_id, new = server.get_http_session(session_id)
+    assert new_id != session_id and new is not session
+    assert list(server.http_sessions) == [new_id]
+
+def test_command_routing():
+    assert [route(cmd) for cmd in ['q', 'ask', 'l', 'show items', 'add x: 1',
+                                   'del x', 'quitt', '']] == \
+        ['quit', 'ask', 'list', 'show', 'add', 'del', 'invalid', 'invalid']
+    ip = ItemPool({'Milk': Item('Milk', 4.25)})
+    app = AppCLI(ShoppingList(size=1, quantities=[2], item_pool=ip), ip)
+    out = io.StringIO()
+    app.run_script(['# seed', 'add Tea: 1.50', '', 'del Milk', 'nope',
+                    'quit', 'list'], out)
+    assert out.getvalue() == 'Item(Tea, 1.5) added successfully.\n\n' \
+        'Milk removed successfully.\n\n"nope" is not a valid command.\n\n' \
+        'Have a nice day!\n\n'
+    # a failing command does not stop the replay
+    out = io.StringIO()
+    AppCLI(ShoppingList(), ItemPool()).run_script(['list', 'stats'], out)
+    replies = out.getvalue().split('\n\n')
+    assert replies[0].startswith('"list" failed: ValueError')
+    assert replies[1].startswith('COMMAND')
+
+def test_benchmarks_compare():
+    results = benchmarks.run([10], ['refresh', 'show_list'], out=io.StringIO())
+    assert set(results) == {'refresh', 'show_list'}
+    assert results['refresh']['10'] > 0
+    thresholds = benchmarks.parse_thresholds(['0.5', 'show_list=2'])
+    assert thresholds == {None: 0.5, 'show_list': 2.0}
+    baseline = {'refresh': {'10': 1.0}, 'show_list': {'10': 1.0}}
+    slower = {'refresh': {'10': 1.6}, 'show_list': {'10': 2.9}}
+    assert benchmarks.compare(baseline, slower, thresholds) == \
+        [('refresh', '10', 1.0, 1.6, 1.6)]
+
+def test_appengine_stats(tmp_path):
+    ip = ItemPool({'Milk': Item('Milk', 4.25)})
+    app = AppCLI(ShoppingList(size=1, quantities=[1], item_pool=ip), ip)
+    for cmd in ['add Milk: 1.00', 'add : 1.00', 'del Tea', 'list', 'list']:
+        app.execute_command(cmd)
+    app.execute_command('add Tea: 0')
+    assert app.app_engine.message == \
+        'Cannot add "Tea": price must be a positive number.'
+    assert 'Tea' not in ip.items
+    stats = app.app_engine.stats
+    assert stats.counts == {'add': 3, 'del': 1, 'list': 2}
+    assert stats.errors == {('add', 'DuplicateItemError'): 1,
+                            ('add', 'InvalidItemNameError'): 1,
+                            ('add', 'InvalidItemPriceError'): 1,
+                            ('del', 'NonExistingItemError'): 1}
+    app.execute_command('stats')
+    assert app.app_engine.message.splitlines()[2].split()[:3] == \
+        ['del', '1', '1']
+    path = tmp_path / 'metrics.prom'
+    stats.write_prometheus(path)
+    text = path.read_text()
+    assert 'shoppinglist_commands_total{command="list"} 2\n' in text
+    assert 'shoppinglist_command_latency_seconds_count{command="add"} 3\n' \
+        in text
+
+def test_stats_render_while_recording():
+    stats = CommandStats()
+    done = threading.Event()
+
+    def record():
+        for i in range(2000):
+            stats.record(f'cmd{i}', 0.001)
+        done.set()
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    while not done.is_set():
+        stats.render_prometheus()
+    thread.join()
+    assert 'shoppinglist_commands_total{command="cmd1999"} 1\n' in \
+        stats.render_prometheus()
+
+def test_loadgen_report():
+    report = loadgen.run_load(workers=2, sessions=3, commands=20,
+                              pool_size=50)
+    assert report['sessions'] == 6
+    assert report['commands'] == 120
+    assert report['commands_per_sec'] > 0
+    assert report['p50_ms'] <= report['p90_ms'] <= report['p99_ms']
+    report = loadgen.run_load(workers=2, sessions=2, commands=10,
+                              pool_size=50, shared=True)
+    assert report['commands'] == 40
+
+def test_process_batch_commands():
+    ip = ItemPool({'Milk': Item('Milk', 4.25)})
+    app = AppCLI(ShoppingList(), ip)
+    app.execute_command('add-many Tea: 1.50; Milk: 2; : 1; Jam: x; Egg: 0; Oat')
+    assert app.app_engine.message == 'Nothing added, 5 of 6 entries failed:\n' \
+        '- Tea: 1.50: added\n- Milk: 2: Duplicate!\n' \
+        '- : 1: Item name string cannot be empty.\n' \
+        '- Jam: x: price must be a positive number\n' \
+        '- Egg: 0: price must be a positive number\n' \
+        '- Oat: usage is <item_name>: <item_price>'
+    app.execute_command('add-many Gold: inf; Lead: 1e3; Tin: -0')
+    assert app.app_engine.message.startswith('Nothing added, 3 of 3')
+    assert app.app_engine.error is InvalidItemPriceError
+    assert ip.get_sorted_names() == ['Milk']
+    app.execute_command('add-many Tea: 1.50; Jam: 3')
+    assert app.app_engine.message == '2 items added:\n- Tea: 1.50: added\n' \
+        '- Jam: 3: added'
+    app.execute_command('del-many Tea; Bread; Tea')
+    assert app.app_engine.message.startswith('Nothing removed, 2 of 3')
+    app.execute_command('del-many Tea; Milk')
+    assert ip.get_sorted_names() == ['Jam']
+    assert app.app_engine.stats.errors == {('add-many', 'DuplicateItemError'): 1,
+                                           ('add-many', 'InvalidItemPriceError'): 1,
+                                           ('del-many', 'NonExistingItemError'): 1}
+
+def test_render_cache():
+    ip = ItemPool({'Milk': Item('Milk', 4.25), 'Tea': Item('Tea', 1.10)})
+    sp = ShoppingList(size=2, quantities=[1, 2], item_pool=ip)
+    app = AppCLI(sp, ip)
+    text = app.show_list()
+    assert app.show_list() is text
+    for i in range(3):
+        assert app.show_list(mask_index=i) == ''.join(app.iter_list_lines(i))
+    version = sp.version
+    sp.add_item(Item('Jam', 3.00))
+    assert sp.version == version + 1
+    assert 'Jam' in app.show_list()
+    app.execute_command('show items')
+    rendered = app.app_engine.message
+    app.execute_command('show items')
+    assert app.app_engine.message is rendered
+    app.execute_command('add Jam: 3.00')
+    app.execute_command('show items')
+    assert app.app_engine.message == 'ITEMS\n- Jam .... $3.00\n' \
+        '- Milk ... $4.25\n- Tea .... $1.10\n'
+
+def test_profiling(tmp_path):
+    app = AppCLI(ShoppingList(), ItemPool({'milk': Item('milk', 1.25)}))
+    app.profile_dir = str(tmp_path / 'profiles')
+    app.execute_command('profile off')
+    assert app.app_engine.message == 'Profiling is not on.'
+    app.execute_command('profile on')
+    assert app.profiler is not None
+    app.execute_command('show items')
+    app.execute_command('show items')
+    app.execute_command('add tea: 1')
+    app.execute_command('profile off')
+    assert app.profiler is None
+    assert app.app_engine.message == 'Profiling off, reports written to ' \
+        f'{tmp_path / "profiles"}/.'
+    assert sorted(path.name for path in (tmp_path / 'profiles').iterdir()) \
+        == ['add.collapsed', 'add.memory.txt', 'add.pstats',
+            'profile.collapsed', 'profile.memory.txt', 'profile.pstats',
+            'show.collapsed', 'show.memory.txt', 'show.pstats']
+    memory = (tmp_path / 'profiles' / 'show.memory.txt').read_text()
+    assert memory.startswith('command: show\ncalls: 2\n')
+    stacks = (tmp_path / 'profiles' / 'show.collapsed').read_text()
+    assert 'process_show' in stacks
+    assert all(line.rsplit(' ', 1)[1].isdigit()
+               for line in stacks.splitlines())